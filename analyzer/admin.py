@@ -1,12 +1,13 @@
 from django.contrib import admin
-from .models import ProductImage
+from .models import ApiClient, Category, Feature, ProductImage, Scenario
 
 @admin.register(ProductImage)
 class ProductImageAdmin(admin.ModelAdmin):
-    list_display = ('product_name', 'recommended_price', 'analyzed', 'story_generated', 'uploaded_at')
-    list_filter = ('analyzed', 'story_generated', 'story_style', 'uploaded_at')
+    list_display = ('product_name', 'category', 'recommended_price', 'analyzed', 'story_generated', 'uploaded_at')
+    list_filter = ('analyzed', 'story_generated', 'story_style', 'category', 'analysis_model', 'uploaded_at')
+    list_select_related = ('category',)
     search_fields = ('product_name', 'description', 'story_content')
-    readonly_fields = ('uploaded_at', 'analysis_json')
+    readonly_fields = ('uploaded_at', 'analysis_json', 'analysis_prompt_hash', 'analysis_model', 'analyzed_at', 'view_count')
     
     fieldsets = (
         ('基本資訊', {
@@ -15,11 +16,25 @@ class ProductImageAdmin(admin.ModelAdmin):
         ('分析結果', {
             'fields': ('product_name', 'description', 'recommended_price', 'analyzed')
         }),
+        ('分類', {
+            'fields': ('category', 'target_audience', 'features', 'usage_scenarios')
+        }),
         ('故事生成', {
             'fields': ('story_prompt', 'story_style', 'story_content', 'story_generated')
         }),
         ('詳細資料', {
-            'fields': ('analysis_json',),
+            'fields': ('analysis_json', 'analysis_prompt_hash', 'analysis_model', 'analyzed_at', 'view_count'),
             'classes': ('collapse',)
         })
     )
+
+@admin.register(Category, Feature, Scenario)
+class CatalogTermAdmin(admin.ModelAdmin):
+    list_display = ('name',)
+    search_fields = ('name',)
+
+@admin.register(ApiClient)
+class ApiClientAdmin(admin.ModelAdmin):
+    list_display = ('client_id', 'total_requests', 'throttled_requests', 'rejected_requests', 'tokens', 'last_seen')
+    search_fields = ('client_id',)
+    readonly_fields = ('client_id', 'tokens', 'last_refill', 'total_requests', 'throttled_requests', 'rejected_requests', 'last_seen')
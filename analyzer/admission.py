@@ -0,0 +1,193 @@
+import contextvars
+import hashlib
+import math
+import os
+import threading
+import time
+from contextlib import contextmanager
+from functools import wraps
+
+from django.conf import settings
+from django.db.models import F, Value
+from django.db.models.functions import Least
+from django.db.models.lookups import GreaterThanOrEqual
+from django.http import JsonResponse
+from django.utils import timezone
+
+from .models import ApiClient
+
+try:
+    import fcntl
+except ImportError:  # Windows 沒有 fcntl，併發上限只在單一 process 內生效
+    fcntl = None
+
+
+class UpstreamBusy(Exception):
+    """全域上游名額在排隊時間內仍未釋出"""
+
+
+# 目前的呼叫是否經過 admission_control；只有經過的 API 請求才受全域上游併發上限約束
+_admitted = contextvars.ContextVar('admission_admitted', default=False)
+
+
+def client_identity(request):
+    """識別用戶端：X-API-Key 為已核發的金鑰時以金鑰識別，否則使用來源 IP
+
+    未核發的金鑰一律視為未帶金鑰，避免用戶端每次換一把隨機金鑰來規避限流。
+    """
+    api_key = request.headers.get('X-API-Key')
+    if api_key and api_key in settings.ADMISSION_API_KEYS:
+        return f"key:{hashlib.sha256(api_key.encode('utf-8')).hexdigest()[:16]}"
+
+    # 位於反向代理之後時，由 X-Forwarded-For 右側數來第 N 個位址為真實來源
+    proxy_count = settings.ADMISSION_PROXY_COUNT
+    forwarded = [ip.strip() for ip in request.META.get('HTTP_X_FORWARDED_FOR', '').split(',') if ip.strip()]
+    if proxy_count and len(forwarded) >= proxy_count:
+        return f'ip:{forwarded[-proxy_count]}'
+    return f"ip:{request.META.get('REMOTE_ADDR', '')}"
+
+
+def take_token(client_id):
+    """從用戶端的 token bucket 取出一個額度
+
+    補充與扣除在同一個條件式 UPDATE 中完成，多個 worker 同時請求也不會超額。
+    回傳 0 表示允許；否則回傳建議等待的秒數。
+    """
+    now = time.time()
+    rate = settings.ADMISSION_RATE
+    burst = float(settings.ADMISSION_BURST)
+    available = Least(Value(burst), F('tokens') + (Value(now) - F('last_refill')) * Value(rate))
+
+    allowed = ApiClient.objects.filter(
+        GreaterThanOrEqual(available, 1),
+        client_id=client_id,
+    ).update(
+        tokens=available - 1,
+        last_refill=now,
+        total_requests=F('total_requests') + 1,
+        last_seen=timezone.now(),
+    )
+    if allowed:
+        return 0
+
+    client, created = ApiClient.objects.get_or_create(
+        client_id=client_id,
+        defaults={'tokens': burst - 1, 'last_refill': now, 'total_requests': 1},
+    )
+    if created:
+        return 0
+
+    ApiClient.objects.filter(pk=client.pk).update(
+        throttled_requests=F('throttled_requests') + 1,
+        last_seen=timezone.now(),
+    )
+    current = min(burst, client.tokens + (now - client.last_refill) * rate)
+    return max(1, math.ceil((1 - current) / rate))
+
+
+_local_slots = None
+_local_slots_lock = threading.Lock()
+
+
+def _local_semaphore():
+    global _local_slots
+    with _local_slots_lock:
+        if _local_slots is None:
+            _local_slots = threading.BoundedSemaphore(settings.ADMISSION_MAX_CONCURRENT)
+    return _local_slots
+
+
+@contextmanager
+def upstream_slot():
+    """取得全域上游呼叫名額，最多等待 ADMISSION_QUEUE_TIMEOUT 秒
+
+    以 ADMISSION_MAX_CONCURRENT 個檔案鎖作為跨 worker 的名額，yield 是否取得名額。
+    """
+    timeout = settings.ADMISSION_QUEUE_TIMEOUT
+    if fcntl is None:
+        semaphore = _local_semaphore()
+        acquired = semaphore.acquire(timeout=timeout)
+        try:
+            yield acquired
+        finally:
+            if acquired:
+                semaphore.release()
+        return
+
+    directory = settings.ADMISSION_SLOT_DIR
+    os.makedirs(directory, exist_ok=True)
+    deadline = time.monotonic() + timeout
+    slot_file = None
+    while slot_file is None:
+        for index in range(settings.ADMISSION_MAX_CONCURRENT):
+            candidate = open(os.path.join(directory, f'slot-{index}.lock'), 'a')
+            try:
+                fcntl.flock(candidate, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                candidate.close()
+                continue
+            slot_file = candidate
+            break
+        if slot_file is None:
+            if time.monotonic() >= deadline:
+                break
+            time.sleep(0.05)
+
+    try:
+        yield slot_file is not None
+    finally:
+        if slot_file is not None:
+            fcntl.flock(slot_file, fcntl.LOCK_UN)
+            slot_file.close()
+
+
+@contextmanager
+def leader_slot():
+    """single-flight leader 實際呼叫上游前取得全域名額，取不到時拋出 UpstreamBusy
+
+    等待中的 follower 不佔名額，因此重試的相同請求會合併到進行中的呼叫，而不是被拒絕。
+    未經 admission_control 的呼叫（網頁上傳、管理指令）不受限制。
+    """
+    if not _admitted.get():
+        yield
+        return
+    with upstream_slot() as acquired:
+        if not acquired:
+            raise UpstreamBusy('服務忙碌中，請稍後再試')
+        yield
+
+
+def _reject(status, error, retry_after):
+    response = JsonResponse({
+        'success': False,
+        'error': error
+    }, status=status)
+    response['Retry-After'] = str(retry_after)
+    return response
+
+
+def admission_control(view):
+    """API 入口控管：每個用戶端的 token bucket 限流 + 全域上游併發上限
+
+    超過用戶端額度回傳 429；實際呼叫上游時（見 leader_slot）全域名額在排隊時間內仍未釋出
+    則回傳 503，兩者皆附 Retry-After。
+    """
+    @wraps(view)
+    def wrapper(request, *args, **kwargs):
+        client_id = client_identity(request)
+        retry_after = take_token(client_id)
+        if retry_after:
+            return _reject(429, '請求過於頻繁，請稍後再試', retry_after)
+
+        token = _admitted.set(True)
+        try:
+            return view(request, *args, **kwargs)
+        except UpstreamBusy as e:
+            ApiClient.objects.filter(client_id=client_id).update(
+                rejected_requests=F('rejected_requests') + 1
+            )
+            return _reject(503, str(e), settings.ADMISSION_RETRY_AFTER)
+        finally:
+            _admitted.reset(token)
+
+    return wrapper
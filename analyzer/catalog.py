@@ -0,0 +1,105 @@
+import math
+from decimal import Decimal, InvalidOperation
+
+from django.db.models import Count, F, Q, Window
+from django.db.models.functions import Ceil, RowNumber
+
+from .models import Feature, ProductImage, Scenario
+
+# 各類別回報的售價百分位數
+PRICE_PERCENTILES = (25, 50, 75, 90)
+FACET_LIMIT = 20
+
+
+def _parse_price(value):
+    try:
+        price = Decimal(value)
+    except InvalidOperation:
+        raise ValueError(f'無效的價格：{value}')
+    if not price.is_finite():
+        raise ValueError(f'無效的價格：{value}')
+    return price
+
+
+def filter_products(queryset, params):
+    """依查詢參數篩選商品（類別、價格區間、特色、使用場景、目標客群）
+
+    參數格式錯誤時拋出 ValueError。
+    """
+    if params.get('category'):
+        queryset = queryset.filter(category__name=params['category'])
+    if params.get('min_price'):
+        queryset = queryset.filter(recommended_price__gte=_parse_price(params['min_price']))
+    if params.get('max_price'):
+        queryset = queryset.filter(recommended_price__lte=_parse_price(params['max_price']))
+    if params.get('target_audience'):
+        queryset = queryset.filter(target_audience=params['target_audience'])
+    # 多個特色 / 場景為「且」條件
+    for name in params.getlist('feature'):
+        queryset = queryset.filter(features__name=name)
+    for name in params.getlist('scenario'):
+        queryset = queryset.filter(usage_scenarios__name=name)
+    return queryset
+
+
+def category_counts(queryset):
+    """各類別商品數（單一 GROUP BY 查詢）"""
+    return list(
+        queryset.filter(category__isnull=False)
+        .values(name=F('category__name'))
+        .annotate(product_count=Count('id'))
+        .order_by('-product_count', 'name')
+    )
+
+
+def category_price_percentiles(queryset):
+    """各類別售價百分位數（nearest-rank 法，單一視窗函數查詢）
+
+    只取回每個類別中落在百分位位置的資料列，不載入整個類別的價格。
+    """
+    ranked = queryset.filter(
+        category__isnull=False,
+        recommended_price__isnull=False,
+    ).annotate(
+        position=Window(RowNumber(), partition_by=F('category'), order_by=F('recommended_price').asc()),
+        total=Window(Count('id'), partition_by=F('category')),
+    )
+    condition = Q()
+    for percentile in PRICE_PERCENTILES:
+        condition |= Q(position=Ceil(F('total') * percentile / 100.0))
+    rows = ranked.filter(condition).values_list('category__name', 'recommended_price', 'position', 'total')
+
+    result = {}
+    for name, price, position, total in rows:
+        percentiles = result.setdefault(name, {})
+        for percentile in PRICE_PERCENTILES:
+            if math.ceil(total * percentile / 100) == position:
+                percentiles[f'p{percentile}'] = float(price)
+    return result
+
+
+def facet_counts(model, queryset, limit=FACET_LIMIT):
+    """特色或使用場景在篩選結果中的出現次數（單一 JOIN + GROUP BY 查詢）"""
+    return list(
+        model.objects.filter(products__in=queryset)
+        .values('name')
+        .annotate(count=Count('products'))
+        .order_by('-count', 'name')[:limit]
+    )
+
+
+def catalog_summary(params):
+    """篩選後的類別統計、售價百分位數與特色 / 場景 facets"""
+    queryset = filter_products(ProductImage.objects.order_by(), params)
+    percentiles = category_price_percentiles(queryset)
+    categories = [
+        {**row, 'price_percentiles': percentiles.get(row['name'], {})}
+        for row in category_counts(queryset)
+    ]
+    return {
+        'categories': categories,
+        'facets': {
+            'features': facet_counts(Feature, queryset),
+            'usage_scenarios': facet_counts(Scenario, queryset),
+        },
+    }
@@ -1,5 +1,14 @@
 from django import forms
 from .models import ProductImage
+from .validators import validate_image_header
+
+class GatedImageField(forms.ImageField):
+    """先以檔頭檢查大小、格式與像素數，通過後才進行 Pillow 完整驗證"""
+    
+    def to_python(self, data):
+        if data not in self.empty_values:
+            validate_image_header(data)
+        return super().to_python(data)
 
 class ProductImageForm(forms.ModelForm):
     """商品圖片上傳表單"""
@@ -7,6 +16,9 @@ class ProductImageForm(forms.ModelForm):
     class Meta:
         model = ProductImage
         fields = ['image']
+        field_classes = {
+            'image': GatedImageField,
+        }
         widgets = {
             'image': forms.ClearableFileInput(attrs={
                 'class': 'form-control',
@@ -18,7 +30,7 @@ class ProductImageForm(forms.ModelForm):
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
         self.fields['image'].label = '選擇農產品圖片'
-        self.fields['image'].help_text = '支援 JPG、PNG、GIF 等圖片格式'
+        self.fields['image'].help_text = '支援 JPG、PNG、GIF、WEBP 等圖片格式'
 
 class StoryGenerationForm(forms.Form):
     """故事生成表單"""
@@ -0,0 +1,56 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+
+from analyzer.models import ProductImage
+
+
+class Command(BaseCommand):
+    help = '由既有的 analysis_json 回填類別、目標客群、特色與使用場景分類表'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=200,
+            help='每個交易處理的筆數（預設 200）',
+        )
+        parser.add_argument(
+            '--only-missing',
+            action='store_true',
+            help='只處理尚未設定類別的資料',
+        )
+
+    def handle(self, *args, **options):
+        queryset = ProductImage.objects.filter(analysis_json__isnull=False).order_by('pk')
+        if options['only_missing']:
+            queryset = queryset.filter(category__isnull=True)
+
+        batch_size = options['batch_size']
+        processed = 0
+        last_pk = 0
+        while True:
+            batch = list(
+                queryset.filter(pk__gt=last_pk)
+                .only('pk', 'analysis_json', 'category', 'target_audience')[:batch_size]
+            )
+            if not batch:
+                break
+            with transaction.atomic():
+                for product in batch:
+                    product.apply_catalog_fields()
+                    # 直接更新分類欄位（不重新同步整筆資料）；分類欄位會出現在 API 回應中，
+                    # 因此仍遞增資料版本讓快取的 ETag 失效
+                    ProductImage.objects.filter(pk=product.pk).update(
+                        category=product.category,
+                        target_audience=product.target_audience,
+                        version=F('version') + 1,
+                        updated_at=timezone.now(),
+                    )
+                    product.sync_catalog_relations()
+            processed += len(batch)
+            last_pk = batch[-1].pk
+            self.stdout.write(f'已處理 {processed} 筆')
+
+        self.stdout.write(self.style.SUCCESS(f'回填完成，共 {processed} 筆'))
@@ -0,0 +1,63 @@
+import os
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from analyzer.models import ProductImage
+
+
+class Command(BaseCommand):
+    help = '清除 media 中已無任何 ProductImage 參照的孤兒檔案'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='只列出將被刪除的檔案，不實際刪除',
+        )
+        parser.add_argument(
+            '--min-age',
+            type=int,
+            default=None,
+            help='只刪除修改時間超過此秒數的檔案，避免誤刪上傳中的檔案（預設為 MEDIA_ORPHAN_GRACE）',
+        )
+
+    def handle(self, *args, **options):
+        field = ProductImage._meta.get_field('image')
+        storage = field.storage
+        root = storage.path('uploads')
+        if not os.path.isdir(root):
+            self.stdout.write('沒有需要檢查的檔案。')
+            return
+
+        referenced = set(
+            ProductImage.objects.exclude(image='').values_list('image', flat=True)
+        )
+        min_age = options['min_age'] if options['min_age'] is not None else settings.MEDIA_ORPHAN_GRACE
+        cutoff = time.time() - min_age
+        removed = 0
+        freed = 0
+
+        # 不移除已清空的分層目錄：併發上傳可能正要在同一目錄寫入檔案，
+        # 而分層目錄數量有上限（256 x 256），保留空目錄的成本可忽略
+        for dirpath, dirnames, filenames in os.walk(root):
+            for filename in filenames:
+                full_path = os.path.join(dirpath, filename)
+                name = os.path.relpath(full_path, storage.location).replace(os.sep, '/')
+                if name in referenced:
+                    continue
+                stat = os.stat(full_path)
+                if stat.st_mtime > cutoff:
+                    continue
+                removed += 1
+                freed += stat.st_size
+                if options['dry_run']:
+                    self.stdout.write(f'將刪除：{name}')
+                else:
+                    storage.delete(name)
+
+        action = '可刪除' if options['dry_run'] else '已刪除'
+        self.stdout.write(self.style.SUCCESS(
+            f'{action} {removed} 個孤兒檔案，共 {freed / 1024 / 1024:.2f} MB'
+        ))
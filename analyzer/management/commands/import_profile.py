@@ -0,0 +1,62 @@
+import subprocess
+import sys
+
+from django.core.management.base import BaseCommand, CommandError
+
+# 在乾淨的 process 中載入 WSGI 應用程式並匯入重量級模組
+PROFILE_SCRIPT = (
+    "import os;"
+    "os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'product_analyzer.settings');"
+    "os.environ['LAZY_IMPORTS'] = 'True';"
+    "import product_analyzer.wsgi;"
+    "from analyzer.startup import preload_modules;"
+    "preload_modules()"
+)
+
+
+class Command(BaseCommand):
+    help = '量測啟動時各模組的匯入耗時（python -X importtime），可設定門檻以偵測退化'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--top',
+            type=int,
+            default=15,
+            help='列出累計耗時最高的前 N 個模組（預設 15）',
+        )
+        parser.add_argument(
+            '--max-ms',
+            type=float,
+            default=None,
+            help='總匯入耗時超過此毫秒數時以錯誤結束',
+        )
+
+    def handle(self, *args, **options):
+        result = subprocess.run(
+            [sys.executable, '-X', 'importtime', '-c', PROFILE_SCRIPT],
+            capture_output=True,
+            text=True,
+        )
+        if result.returncode != 0:
+            raise CommandError(f'載入應用程式失敗：\n{result.stderr[-2000:]}')
+
+        entries = []
+        for line in result.stderr.splitlines():
+            if not line.startswith('import time:') or 'self [us]' in line:
+                continue
+            head, cumulative_us, module = line.split('|', 2)
+            self_us = head.split(':', 1)[1]
+            depth = len(module) - len(module.lstrip())
+            entries.append((module.strip(), int(self_us), int(cumulative_us), depth))
+
+        # 頂層匯入的累計耗時總和即為整體匯入耗時
+        top_level = min(depth for _, _, _, depth in entries)
+        total_ms = sum(cumulative for _, _, cumulative, depth in entries if depth == top_level) / 1000
+
+        self.stdout.write(f'{"模組":<50} {"自身 ms":>10} {"累計 ms":>10}')
+        for module, self_us, cumulative_us, _ in sorted(entries, key=lambda e: e[2], reverse=True)[:options['top']]:
+            self.stdout.write(f'{module:<50} {self_us / 1000:>10.1f} {cumulative_us / 1000:>10.1f}')
+        self.stdout.write(f'總匯入耗時：{total_ms:.1f} ms')
+
+        if options['max_ms'] is not None and total_ms > options['max_ms']:
+            raise CommandError(f'匯入耗時 {total_ms:.1f} ms 超過門檻 {options["max_ms"]:.1f} ms')
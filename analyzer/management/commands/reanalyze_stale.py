@@ -0,0 +1,94 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from analyzer.models import ProductImage
+from analyzer.services import OpenAIService, analysis_version, is_failed_analysis
+
+
+class Command(BaseCommand):
+    help = '重新分析由舊版提示詞或模型產生的分析結果（依優先順序，在預算內逐筆處理）'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--limit',
+            type=int,
+            default=50,
+            help='本次最多重新分析的筆數（預設 50）',
+        )
+        parser.add_argument(
+            '--max-seconds',
+            type=float,
+            default=None,
+            help='本次執行的時間上限（秒），超過後不再開始新的分析',
+        )
+        parser.add_argument(
+            '--order',
+            choices=['views', 'newest'],
+            default='views',
+            help='處理順序：views 為瀏覽次數最多者優先（預設），newest 為最新上傳者優先',
+        )
+        parser.add_argument(
+            '--sleep',
+            type=float,
+            default=0,
+            help='每筆之間的間隔秒數，用於控制上游請求速率',
+        )
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='只列出過期的資料，不實際重新分析',
+        )
+
+    def handle(self, *args, **options):
+        prompt_hash, model = analysis_version()
+        stale = ProductImage.objects.filter(analyzed=True).exclude(
+            analysis_prompt_hash=prompt_hash,
+            analysis_model=model,
+        )
+        self.stdout.write(f'目前版本：{prompt_hash[:12]} / {model}，過期資料 {stale.count()} 筆')
+
+        if options['order'] == 'views':
+            stale = stale.order_by('-view_count', '-uploaded_at')
+        else:
+            stale = stale.order_by('-uploaded_at')
+        products = list(stale[:options['limit']])
+
+        if options['dry_run']:
+            for product in products:
+                self.stdout.write(
+                    f'將重新分析：#{product.pk} {product.product_name}'
+                    f'（{product.analysis_model or "未記錄"} / {product.analysis_prompt_hash[:12] or "未記錄"}）'
+                )
+            return
+
+        deadline = None
+        if options['max_seconds'] is not None:
+            deadline = time.monotonic() + options['max_seconds']
+
+        service = OpenAIService()
+        updated = failed = 0
+        for product in products:
+            if deadline is not None and time.monotonic() >= deadline:
+                self.stdout.write('已達時間上限，停止處理')
+                break
+
+            try:
+                result = service.analyze_product_image(product.image.path)
+            except Exception as e:
+                result = {'error': str(e)}
+
+            # 失敗時保留原本的分析結果，留待下次重試
+            if is_failed_analysis(result):
+                failed += 1
+                self.stdout.write(self.style.WARNING(f'#{product.pk} 重新分析失敗：{result.get("error", "回應解析失敗")}'))
+            else:
+                product.apply_analysis(result, prompt_hash, model)
+                product.save(update_fields=ProductImage.ANALYSIS_FIELDS)
+                updated += 1
+                self.stdout.write(f'#{product.pk} 已更新：{product.product_name}')
+
+            if options['sleep']:
+                time.sleep(options['sleep'])
+
+        self.stdout.write(self.style.SUCCESS(f'重新分析完成：更新 {updated} 筆，失敗 {failed} 筆'))
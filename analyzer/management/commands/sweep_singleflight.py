@@ -0,0 +1,12 @@
+from django.core.management.base import BaseCommand
+
+from analyzer.singleflight import sweep
+
+
+class Command(BaseCommand):
+    help = '清理請求合併（single-flight）共用目錄中的過期結果檔與閒置鎖檔'
+
+    def handle(self, *args, **options):
+        # 執行中的 worker 也會定期自動清理，此指令供 worker 長時間閒置或停機後使用
+        removed = sweep()
+        self.stdout.write(self.style.SUCCESS(f'已清理 {removed} 個請求合併暫存檔'))
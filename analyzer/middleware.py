@@ -0,0 +1,49 @@
+from django.conf import settings
+from django.contrib import messages
+from django.http import HttpResponse, JsonResponse
+from django.shortcuts import render
+from django.template.defaultfilters import filesizeformat
+from django.urls import Resolver404, resolve
+
+from .forms import ProductImageForm
+
+
+class UploadSizeLimitMiddleware:
+    """依 Content-Length 拒絕明顯過大的請求本體，直接回傳 413
+
+    在進入視圖階段之前回應，因此 CsrfViewMiddleware 不會讀取 request.POST，
+    也不會因為本體未解析而誤判為 CSRF 失敗（403）。Content-Length 未超過上限、
+    但實際串流超過的上傳則由 UploadSizeLimitHandler 中止。
+    需排在 MessageMiddleware 之後，才能在上傳頁面顯示錯誤訊息。
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        try:
+            content_length = int(request.META.get('CONTENT_LENGTH') or 0)
+        except ValueError:
+            content_length = 0
+        # 檔案上限 + 一般欄位上限
+        max_body = settings.UPLOAD_MAX_BYTES + (settings.DATA_UPLOAD_MAX_MEMORY_SIZE or 0)
+        if content_length > max_body:
+            return self.too_large(request)
+        return self.get_response(request)
+
+    def too_large(self, request):
+        error = f'檔案超過大小上限 {filesizeformat(settings.UPLOAD_MAX_BYTES)}'
+        try:
+            url_name = resolve(request.path_info).url_name or ''
+        except Resolver404:
+            url_name = ''
+
+        if url_name.startswith('api_'):
+            return JsonResponse({
+                'success': False,
+                'error': error
+            }, status=413)
+        if url_name == 'upload':
+            messages.error(request, f'圖片上傳失敗：{error}')
+            return render(request, 'analyzer/upload.html', {'form': ProductImageForm()}, status=413)
+        return HttpResponse(error, status=413, content_type='text/plain; charset=utf-8')
@@ -0,0 +1,25 @@
+# Generated by Django 5.1.4 on 2026-10-19 09:00
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('analyzer', '0002_productimage_story_content_and_more'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='productimage',
+            name='version',
+            field=models.PositiveIntegerField(default=1, verbose_name='資料版本'),
+        ),
+        migrations.AddField(
+            model_name='productimage',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True, default=django.utils.timezone.now, verbose_name='更新時間'),
+            preserve_default=False,
+        ),
+    ]
@@ -0,0 +1,20 @@
+# Generated by Django 5.1.4 on 2026-10-19 19:45
+
+import analyzer.models
+import analyzer.storage
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('analyzer', '0003_productimage_version_updated_at'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='productimage',
+            name='image',
+            field=models.ImageField(storage=analyzer.storage.ContentAddressedStorage(), upload_to=analyzer.models.upload_to, verbose_name='商品圖片'),
+        ),
+    ]
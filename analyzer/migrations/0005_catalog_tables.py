@@ -0,0 +1,74 @@
+# Generated by Django 5.1.4 on 2026-10-19 19:51
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('analyzer', '0004_alter_productimage_image'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Category',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=100, unique=True, verbose_name='類別名稱')),
+            ],
+            options={
+                'verbose_name': '商品類別',
+                'verbose_name_plural': '商品類別',
+                'ordering': ['name'],
+            },
+        ),
+        migrations.CreateModel(
+            name='Feature',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=100, unique=True, verbose_name='特色')),
+            ],
+            options={
+                'verbose_name': '商品特色',
+                'verbose_name_plural': '商品特色',
+                'ordering': ['name'],
+            },
+        ),
+        migrations.CreateModel(
+            name='Scenario',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=100, unique=True, verbose_name='使用場景')),
+            ],
+            options={
+                'verbose_name': '使用場景',
+                'verbose_name_plural': '使用場景',
+                'ordering': ['name'],
+            },
+        ),
+        migrations.AddField(
+            model_name='productimage',
+            name='target_audience',
+            field=models.CharField(blank=True, db_index=True, max_length=200, verbose_name='目標客群'),
+        ),
+        migrations.AddField(
+            model_name='productimage',
+            name='category',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='products', to='analyzer.category', verbose_name='商品類別'),
+        ),
+        migrations.AddField(
+            model_name='productimage',
+            name='features',
+            field=models.ManyToManyField(blank=True, related_name='products', to='analyzer.feature', verbose_name='商品特色'),
+        ),
+        migrations.AddField(
+            model_name='productimage',
+            name='usage_scenarios',
+            field=models.ManyToManyField(blank=True, related_name='products', to='analyzer.scenario', verbose_name='使用場景'),
+        ),
+        migrations.AddIndex(
+            model_name='productimage',
+            index=models.Index(fields=['category', 'recommended_price'], name='analyzer_category_price_idx'),
+        ),
+    ]
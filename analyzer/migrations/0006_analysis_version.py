@@ -0,0 +1,37 @@
+# Generated by Django 5.1.4 on 2026-10-19 19:53
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('analyzer', '0005_catalog_tables'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='productimage',
+            name='analysis_model',
+            field=models.CharField(blank=True, max_length=100, verbose_name='分析模型'),
+        ),
+        migrations.AddField(
+            model_name='productimage',
+            name='analysis_prompt_hash',
+            field=models.CharField(blank=True, max_length=64, verbose_name='分析提示詞版本'),
+        ),
+        migrations.AddField(
+            model_name='productimage',
+            name='analyzed_at',
+            field=models.DateTimeField(blank=True, null=True, verbose_name='分析時間'),
+        ),
+        migrations.AddField(
+            model_name='productimage',
+            name='view_count',
+            field=models.PositiveIntegerField(default=0, verbose_name='瀏覽次數'),
+        ),
+        migrations.AddIndex(
+            model_name='productimage',
+            index=models.Index(fields=['analysis_prompt_hash', 'analysis_model'], name='analyzer_analysis_version_idx'),
+        ),
+    ]
@@ -0,0 +1,31 @@
+# Generated by Django 5.1.4 on 2026-10-19 19:54
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('analyzer', '0006_analysis_version'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ApiClient',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('client_id', models.CharField(max_length=100, unique=True, verbose_name='用戶端')),
+                ('tokens', models.FloatField(verbose_name='剩餘額度')),
+                ('last_refill', models.FloatField(verbose_name='最後補充時間')),
+                ('total_requests', models.PositiveIntegerField(default=0, verbose_name='允許請求數')),
+                ('throttled_requests', models.PositiveIntegerField(default=0, verbose_name='限流次數')),
+                ('rejected_requests', models.PositiveIntegerField(default=0, verbose_name='忙碌拒絕次數')),
+                ('last_seen', models.DateTimeField(auto_now=True, verbose_name='最後請求時間')),
+            ],
+            options={
+                'verbose_name': 'API 用戶端',
+                'verbose_name_plural': 'API 用戶端',
+                'ordering': ['-last_seen'],
+            },
+        ),
+    ]
@@ -1,16 +1,75 @@
 from django.db import models
+from django.utils import timezone
+import re
 import uuid
 import os
 
+from .storage import image_storage
+
 def upload_to(instance, filename):
     """產生上傳檔案路徑"""
     ext = filename.split('.')[-1]
     filename = f"{uuid.uuid4()}.{ext}"
     return os.path.join('uploads', filename)
 
+# 分析結果中代表「無資料」的值，不寫入分類表
+CATALOG_PLACEHOLDERS = {'', '未知', '錯誤', '未知類別'}
+
+def _catalog_name(value, max_length):
+    """正規化分類/特色名稱，無效值回傳空字串"""
+    if not isinstance(value, str):
+        return ''
+    value = value.strip()[:max_length]
+    return '' if value in CATALOG_PLACEHOLDERS else value
+
+def _catalog_names(values, max_length):
+    """正規化名稱清單並去除重複"""
+    if isinstance(values, str):
+        values = [values]
+    if not isinstance(values, list):
+        return []
+    names = (_catalog_name(value, max_length) for value in values)
+    return list(dict.fromkeys(name for name in names if name))
+
+class Category(models.Model):
+    """商品類別"""
+    name = models.CharField(max_length=100, unique=True, verbose_name='類別名稱')
+    
+    class Meta:
+        verbose_name = '商品類別'
+        verbose_name_plural = '商品類別'
+        ordering = ['name']
+    
+    def __str__(self):
+        return self.name
+
+class Feature(models.Model):
+    """商品特色"""
+    name = models.CharField(max_length=100, unique=True, verbose_name='特色')
+    
+    class Meta:
+        verbose_name = '商品特色'
+        verbose_name_plural = '商品特色'
+        ordering = ['name']
+    
+    def __str__(self):
+        return self.name
+
+class Scenario(models.Model):
+    """使用場景"""
+    name = models.CharField(max_length=100, unique=True, verbose_name='使用場景')
+    
+    class Meta:
+        verbose_name = '使用場景'
+        verbose_name_plural = '使用場景'
+        ordering = ['name']
+    
+    def __str__(self):
+        return self.name
+
 class ProductImage(models.Model):
     """商品圖片模型"""
-    image = models.ImageField(upload_to=upload_to, verbose_name='商品圖片')
+    image = models.ImageField(upload_to=upload_to, storage=image_storage, verbose_name='商品圖片')
     uploaded_at = models.DateTimeField(auto_now_add=True, verbose_name='上傳時間')
     
     # AI 分析結果
@@ -26,16 +85,146 @@ class ProductImage(models.Model):
     analysis_json = models.JSONField(null=True, blank=True, verbose_name='完整分析結果')
     analyzed = models.BooleanField(default=False, verbose_name='已分析')
     
+    # 產生分析結果的提示詞版本與模型，用於找出需要重新分析的過期資料
+    analysis_prompt_hash = models.CharField(max_length=64, blank=True, verbose_name='分析提示詞版本')
+    analysis_model = models.CharField(max_length=100, blank=True, verbose_name='分析模型')
+    analyzed_at = models.DateTimeField(null=True, blank=True, verbose_name='分析時間')
+    view_count = models.PositiveIntegerField(default=0, verbose_name='瀏覽次數')
+    
+    # 由 analysis_json 萃取的正規化分類欄位（儲存時自動同步，供篩選與統計）
+    category = models.ForeignKey(
+        Category,
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name='products',
+        verbose_name='商品類別'
+    )
+    target_audience = models.CharField(max_length=200, blank=True, db_index=True, verbose_name='目標客群')
+    features = models.ManyToManyField(Feature, blank=True, related_name='products', verbose_name='商品特色')
+    usage_scenarios = models.ManyToManyField(Scenario, blank=True, related_name='products', verbose_name='使用場景')
+    
     # 故事生成相關欄位
     story_content = models.TextField(blank=True, verbose_name='產品故事')
     story_style = models.CharField(max_length=50, blank=True, verbose_name='故事風格')
     story_prompt = models.TextField(blank=True, verbose_name='使用者故事指令')
     story_generated = models.BooleanField(default=False, verbose_name='已生成故事')
     
+    # 資料版本（供 API 的 ETag / Last-Modified 使用）
+    version = models.PositiveIntegerField(default=1, verbose_name='資料版本')
+    updated_at = models.DateTimeField(auto_now=True, verbose_name='更新時間')
+    
     class Meta:
         verbose_name = '商品圖片'
         verbose_name_plural = '商品圖片'
         ordering = ['-uploaded_at']
+        indexes = [
+            models.Index(fields=['category', 'recommended_price'], name='analyzer_category_price_idx'),
+            models.Index(fields=['analysis_prompt_hash', 'analysis_model'], name='analyzer_analysis_version_idx'),
+        ]
+    
+    # 套用分析結果時會更新的欄位（供 save(update_fields=...) 使用）
+    ANALYSIS_FIELDS = [
+        'product_name', 'description', 'recommended_price', 'analysis_json', 'analyzed',
+        'analysis_prompt_hash', 'analysis_model', 'analyzed_at',
+    ]
     
     def __str__(self):
         return f"商品圖片 - {self.product_name or '未分析'}"
+    
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # 記錄載入時的分析結果，儲存時只在內容變更後才重新同步分類表
+        if 'analysis_json' in field_names:
+            instance._synced_analysis = instance.analysis_json
+        return instance
+    
+    def save(self, *args, **kwargs):
+        """儲存時遞增資料版本，並在分析結果變更時同步分類表"""
+        update_fields = kwargs.get('update_fields')
+        sync_catalog = (
+            'analysis_json' not in self.get_deferred_fields()
+            and (update_fields is None or 'analysis_json' in update_fields)
+            and getattr(self, '_synced_analysis', None) != self.analysis_json
+        )
+        if sync_catalog:
+            self.apply_catalog_fields()
+        
+        bump_version = self.pk is not None and not self._state.adding
+        if bump_version:
+            # 在資料庫內遞增，避免併發儲存寫入相同版本號
+            self.version = models.F('version') + 1
+            if update_fields is not None:
+                extra = {'version', 'updated_at'}
+                if sync_catalog:
+                    extra |= {'category', 'target_audience'}
+                kwargs['update_fields'] = {*update_fields, *extra}
+        super().save(*args, **kwargs)
+        if bump_version:
+            self.refresh_from_db(fields=['version'])
+        
+        if sync_catalog:
+            self.sync_catalog_relations()
+            self._synced_analysis = self.analysis_json
+    
+    def apply_analysis(self, result, prompt_hash='', model=''):
+        """套用 AI 分析結果並記錄產生結果的提示詞版本與模型（不儲存）"""
+        self.product_name = result.get('product_name', '')
+        self.description = result.get('description', '')
+        
+        # 安全處理價格
+        try:
+            price = result.get('recommended_price', 0)
+            if isinstance(price, str):
+                price_str = re.sub(r'[^\d.]', '', price)
+                self.recommended_price = float(price_str) if price_str else 0
+            else:
+                self.recommended_price = float(price) if price else 0
+        except (ValueError, TypeError):
+            self.recommended_price = 0
+        
+        self.analysis_json = result
+        self.analyzed = True
+        self.analysis_prompt_hash = prompt_hash
+        self.analysis_model = model
+        self.analyzed_at = timezone.now()
+    
+    def apply_catalog_fields(self):
+        """由 analysis_json 設定類別與目標客群（不儲存）"""
+        analysis = self.analysis_json if isinstance(self.analysis_json, dict) else {}
+        category_name = _catalog_name(analysis.get('category'), Category._meta.get_field('name').max_length)
+        self.category = Category.objects.get_or_create(name=category_name)[0] if category_name else None
+        self.target_audience = _catalog_name(
+            analysis.get('target_audience'),
+            self._meta.get_field('target_audience').max_length
+        )
+    
+    def sync_catalog_relations(self):
+        """由 analysis_json 同步特色與使用場景的多對多關聯"""
+        analysis = self.analysis_json if isinstance(self.analysis_json, dict) else {}
+        for relation, model, key in (
+            (self.features, Feature, 'features'),
+            (self.usage_scenarios, Scenario, 'usage_scenarios'),
+        ):
+            names = _catalog_names(analysis.get(key), model._meta.get_field('name').max_length)
+            model.objects.bulk_create([model(name=name) for name in names], ignore_conflicts=True)
+            relation.set(model.objects.filter(name__in=names))
+
+class ApiClient(models.Model):
+    """API 用戶端的限流狀態與用量統計（token bucket，跨 worker 共用）"""
+    client_id = models.CharField(max_length=100, unique=True, verbose_name='用戶端')
+    tokens = models.FloatField(verbose_name='剩餘額度')
+    last_refill = models.FloatField(verbose_name='最後補充時間')
+    total_requests = models.PositiveIntegerField(default=0, verbose_name='允許請求數')
+    throttled_requests = models.PositiveIntegerField(default=0, verbose_name='限流次數')
+    rejected_requests = models.PositiveIntegerField(default=0, verbose_name='忙碌拒絕次數')
+    last_seen = models.DateTimeField(auto_now=True, verbose_name='最後請求時間')
+    
+    class Meta:
+        verbose_name = 'API 用戶端'
+        verbose_name_plural = 'API 用戶端'
+        ordering = ['-last_seen']
+    
+    def __str__(self):
+        return self.client_id
@@ -0,0 +1,196 @@
+import re
+import threading
+import time
+
+from django.conf import settings
+
+# x-ratelimit-reset-requests 的時間格式，例如 "20ms"、"1s"、"6m0s"
+_DURATION_PART = re.compile(r'(\d+(?:\.\d+)?)(ms|h|m|s)')
+_DURATION_UNITS = {'ms': 0.001, 's': 1, 'm': 60, 'h': 3600}
+
+
+def _parse_duration(value):
+    """解析速率限制重置時間，無法解析時回傳 None"""
+    parts = _DURATION_PART.findall(value or '')
+    if not parts:
+        return None
+    return sum(float(number) * _DURATION_UNITS[unit] for number, unit in parts)
+
+
+class Backend:
+    """單一 OpenAI 相容後端（一組 API 金鑰 + 端點）與其執行狀態"""
+
+    def __init__(self, name, api_key, base_url=None, max_retries=None):
+        self.name = name
+        self.api_key = api_key
+        self.base_url = base_url
+        self.max_retries = max_retries
+        self._client = None
+
+        self.outstanding = 0
+        self.requests = 0
+        self.failures = 0
+        self.consecutive_failures = 0
+        self.ejected_until = 0.0
+        self.latency_ms = None
+        self.remaining_requests = None
+        self.quota_expires_at = 0.0
+
+    @property
+    def client(self):
+        """延遲建立 client，第一次使用時才匯入 openai"""
+        if self._client is None:
+            import openai
+            options = {'api_key': self.api_key, 'base_url': self.base_url}
+            if self.max_retries is not None:
+                options['max_retries'] = self.max_retries
+            self._client = openai.OpenAI(**options)
+        return self._client
+
+    def is_healthy(self, now):
+        return now >= self.ejected_until
+
+    def quota_remaining(self, now):
+        """最近一次回報的剩餘配額；超過重置時間後的舊讀數不再採用"""
+        return self.remaining_requests if now < self.quota_expires_at else None
+
+    def stats(self, now):
+        return {
+            'name': self.name,
+            'healthy': self.is_healthy(now),
+            'outstanding': self.outstanding,
+            'requests': self.requests,
+            'failures': self.failures,
+            'latency_ms': round(self.latency_ms, 1) if self.latency_ms is not None else None,
+            'remaining_requests': self.quota_remaining(now),
+        }
+
+
+class ProviderPool:
+    """多金鑰、多端點的後端池
+
+    每次呼叫挑選進行中請求最少的健康後端，同數時優先選剩餘配額較多、延遲較低者。
+    後端發生限流、連線或伺服器錯誤時暫時剔除，並改由下一個後端重試。
+    """
+
+    # 延遲的指數移動平均權重
+    latency_alpha = 0.2
+
+    def __init__(self, backends):
+        self.backends = backends
+        self._lock = threading.Lock()
+
+    def _acquire(self, exclude):
+        now = time.monotonic()
+        with self._lock:
+            candidates = [b for b in self.backends if b not in exclude]
+            if not candidates:
+                raise Exception('未設定可用的 OpenAI API 金鑰')
+            healthy = [b for b in candidates if b.is_healthy(now)]
+            if healthy:
+                backend = min(healthy, key=lambda b: (
+                    b.quota_remaining(now) == 0,
+                    b.outstanding,
+                    -(b.quota_remaining(now) or 0),
+                    b.latency_ms or 0,
+                ))
+            else:
+                # 全部被剔除時，選最快恢復者，不讓請求直接失敗
+                backend = min(candidates, key=lambda b: b.ejected_until)
+            backend.outstanding += 1
+            return backend
+
+    def _release(self, backend, elapsed=None, headers=None, failed=False):
+        with self._lock:
+            backend.outstanding -= 1
+            backend.requests += 1
+            if failed:
+                backend.failures += 1
+                backend.consecutive_failures += 1
+                # 連續失敗時剔除時間加倍，最長不超過上限
+                eject_seconds = min(
+                    settings.OPENAI_BACKEND_EJECT_SECONDS * 2 ** (backend.consecutive_failures - 1),
+                    settings.OPENAI_BACKEND_MAX_EJECT_SECONDS,
+                )
+                backend.ejected_until = time.monotonic() + eject_seconds
+            elif elapsed is not None:
+                elapsed_ms = elapsed * 1000
+                if backend.latency_ms is None:
+                    backend.latency_ms = elapsed_ms
+                else:
+                    backend.latency_ms += self.latency_alpha * (elapsed_ms - backend.latency_ms)
+                backend.consecutive_failures = 0
+                headers = headers or {}
+                remaining = headers.get('x-ratelimit-remaining-requests')
+                if remaining is not None and remaining.isdigit():
+                    backend.remaining_requests = int(remaining)
+                    # 讀數在配額重置後失效；沒有重置時間時只採用短時間
+                    reset = _parse_duration(headers.get('x-ratelimit-reset-requests'))
+                    if reset is None:
+                        reset = settings.OPENAI_BACKEND_QUOTA_TTL
+                    backend.quota_expires_at = time.monotonic() + reset
+
+    @staticmethod
+    def _is_backend_error(error):
+        """判斷錯誤是否屬於後端問題（限流、金鑰、連線、伺服器錯誤），而非請求本身有誤"""
+        import openai
+        if isinstance(error, (openai.RateLimitError, openai.AuthenticationError,
+                              openai.PermissionDeniedError, openai.APIConnectionError)):
+            return True
+        return isinstance(error, openai.APIStatusError) and error.status_code >= 500
+
+    def chat_completion(self, **request):
+        """挑選後端呼叫 chat completions，後端錯誤時改用其他後端重試"""
+        tried = set()
+        while True:
+            backend = self._acquire(tried)
+            start = time.monotonic()
+            try:
+                raw = backend.client.chat.completions.with_raw_response.create(**request)
+            except Exception as e:
+                if not self._is_backend_error(e):
+                    # 請求本身有誤，換後端也無濟於事
+                    self._release(backend)
+                    raise
+                self._release(backend, failed=True)
+                tried.add(backend)
+                if len(tried) >= len(self.backends):
+                    raise
+                continue
+            self._release(backend, time.monotonic() - start, headers=raw.headers)
+            return raw.parse()
+
+    def warmup(self):
+        """預先建立所有後端的 client"""
+        for backend in self.backends:
+            backend.client
+
+    def stats(self):
+        now = time.monotonic()
+        with self._lock:
+            return [backend.stats(now) for backend in self.backends]
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_provider_pool():
+    """取得依 OPENAI_BACKENDS 設定建立的共用後端池"""
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                configs = settings.OPENAI_BACKENDS
+                # 有多個後端時由後端池負責換手重試，不讓單一 client 自行重試同一把金鑰
+                max_retries = 0 if len(configs) > 1 else None
+                _pool = ProviderPool([
+                    Backend(
+                        name=config.get('name') or f'backend-{index}',
+                        api_key=config['api_key'],
+                        base_url=config.get('base_url'),
+                        max_retries=config.get('max_retries', max_retries),
+                    )
+                    for index, config in enumerate(configs)
+                ])
+    return _pool
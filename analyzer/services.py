@@ -1,32 +1,16 @@
-import openai
 import json
 import base64
+import hashlib
 from django.conf import settings
-from PIL import Image
-import io
 
-class OpenAIService:
-    """OpenAI API 服務類別"""
-    
-    def __init__(self):
-        self.client = openai.OpenAI(api_key=settings.OPENAI_API_KEY)
-    
-    def encode_image(self, image_path):
-        """將圖片編碼為 base64"""
-        try:
-            with open(image_path, "rb") as image_file:
-                return base64.b64encode(image_file.read()).decode('utf-8')
-        except Exception as e:
-            raise Exception(f"圖片編碼失敗: {str(e)}")
-    
-    def analyze_product_image(self, image_path):
-        """分析商品圖片並回傳 JSON 格式結果"""
-        try:
-            # 編碼圖片
-            base64_image = self.encode_image(image_path)
-            
-            # 準備提示詞
-            prompt = """
+# openai 套件匯入約需數百毫秒，由後端池在第一次使用時才載入以加快冷啟動
+from .admission import UpstreamBusy, leader_slot
+from .providers import get_provider_pool
+from .singleflight import single_flight
+
+# 商品分析使用的模型與提示詞；任一變更都會讓既有分析結果被視為過期（見 analysis_version）
+ANALYSIS_MODEL = "gpt-4o"  # 使用支援視覺的模型
+ANALYSIS_PROMPT = """
                 請仔細分析這張圖片中的商品，並以 JSON 格式回傳以下資訊。
                 即使是原始農產品、食材或物品，也請盡量給出具體的商品名稱和詳細資訊：
                 
@@ -54,17 +38,65 @@ class OpenAIService:
                 4. 請務必以繁體中文回答其他欄位
                 5. 確保回傳的是有效的 JSON 格式
                 """
+
+
+def analysis_version():
+    """目前分析設定的版本：(提示詞雜湊, 模型 id)"""
+    prompt_hash = hashlib.sha256(ANALYSIS_PROMPT.encode('utf-8')).hexdigest()
+    return prompt_hash, ANALYSIS_MODEL
+
+
+def is_failed_analysis(result):
+    """分析結果是否為錯誤或解析失敗的回傳值"""
+    return 'error' in result or 'raw_response' in result
+
+
+class OpenAIService:
+    """OpenAI API 服務類別"""
+    
+    def _complete(self, kind, grace=0, **request):
+        """呼叫 chat completions 並回傳文字內容
+        
+        以請求內容（模型、提示詞、圖片）的雜湊作為 key，相同請求同時進行時只會呼叫一次上游，
+        其餘請求等待並共用結果；完成後 grace 秒內的相同請求也共用同一結果。
+        """
+        payload = json.dumps(request, sort_keys=True, ensure_ascii=False)
+        key = f"{kind}:{hashlib.sha256(payload.encode('utf-8')).hexdigest()}"
+        
+        def _request():
+            # 只有實際呼叫上游的 leader 佔用全域名額
+            with leader_slot():
+                response = get_provider_pool().chat_completion(**request)
+            return response.choices[0].message.content
+        
+        return single_flight(key, _request, grace=grace)
+    
+    def encode_image(self, image_path):
+        """將圖片編碼為 base64"""
+        try:
+            with open(image_path, "rb") as image_file:
+                return base64.b64encode(image_file.read()).decode('utf-8')
+        except Exception as e:
+            raise Exception(f"圖片編碼失敗: {str(e)}")
+    
+    def analyze_product_image(self, image_path):
+        """分析商品圖片並回傳 JSON 格式結果"""
+        try:
+            # 編碼圖片
+            base64_image = self.encode_image(image_path)
             
             # 發送請求到 OpenAI
-            response = self.client.chat.completions.create(
-                model="gpt-4o",  # 使用支援視覺的模型
+            content = self._complete(
+                'analyze',
+                grace=settings.SINGLE_FLIGHT_ANALYZE_GRACE,
+                model=ANALYSIS_MODEL,
                 messages=[
                     {
                         "role": "user",
                         "content": [
                             {
                                 "type": "text",
-                                "text": prompt
+                                "text": ANALYSIS_PROMPT
                             },
                             {
                                 "type": "image_url",
@@ -80,10 +112,6 @@ class OpenAIService:
                 temperature=0.1
             )
             
-            # 解析回應
-            content = response.choices[0].message.content
-
-            
             # 嘗試解析 JSON
             try:
                 # 移除可能的 markdown 代碼塊標記
@@ -132,6 +160,8 @@ class OpenAIService:
                     "raw_response": content
                 }
                 
+        except UpstreamBusy:
+            raise
         except Exception as e:
             return {
                 "product_name": "分析錯誤",
@@ -186,7 +216,8 @@ class OpenAIService:
             請直接回傳故事內容，不需要額外的格式標記。
             """
             
-            response = self.client.chat.completions.create(
+            story_content = self._complete(
+                'story',
                 model="gpt-4o",
                 messages=[
                     {
@@ -196,10 +227,10 @@ class OpenAIService:
                 ],
                 max_tokens=600,
                 temperature=0.7
-            )
-            
-            story_content = response.choices[0].message.content.strip()
+            ).strip()
             return story_content
             
+        except UpstreamBusy:
+            raise
         except Exception as e:
             return f"故事生成失敗：{str(e)}"
\ No newline at end of file
@@ -0,0 +1,24 @@
+from django.db import transaction
+from django.db.models.signals import post_delete
+from django.dispatch import receiver
+
+from .models import ProductImage
+from .storage import reference_count
+
+
+@receiver(post_delete, sender=ProductImage)
+def release_image_file(sender, instance, **kwargs):
+    """刪除 ProductImage 後，若檔案已無其他參照則一併刪除
+
+    寬限期內寫入或被共用的檔案先保留（可能有尚未寫入資料列的上傳正在共用），交由 gc_media 清理。
+    """
+    if not instance.image:
+        return
+    name = instance.image.name
+    storage = instance.image.storage
+
+    def _release():
+        if reference_count(name) == 0 and not storage.recently_used(name):
+            storage.delete(name)
+
+    transaction.on_commit(_release)
@@ -0,0 +1,188 @@
+import hashlib
+import json
+import os
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+
+from django.conf import settings
+
+try:
+    import fcntl
+except ImportError:  # Windows 沒有 fcntl，只提供同一 process 內的合併
+    fcntl = None
+
+
+class _Call:
+    """進行中的呼叫，供同一 process 內的其他執行緒等待結果"""
+
+    def __init__(self):
+        self.event = threading.Event()
+        self.result = None
+        self.error = None
+
+
+_calls = {}
+_calls_lock = threading.Lock()
+
+
+def single_flight(key, fn, grace=0):
+    """合併相同 key 的併發呼叫，只有第一個呼叫者會真正執行 fn
+
+    - 同一 worker 內：其他執行緒等待進行中的呼叫並共用結果（或例外）。
+    - 跨 gunicorn worker：以檔案鎖作為租約，取得租約者執行 fn 並將結果寫入共用目錄，
+      其他 worker 等待租約釋放後直接讀取結果。
+
+    只共用呼叫期間到達的請求；grace 秒數內完成的結果也可共用（供逾時重試使用），
+    預設為 0，呼叫完成後的新請求一律重新呼叫。
+    fn 拋出例外時不會保留結果，下一個請求會重新呼叫。fn 的回傳值必須可序列化為 JSON。
+    """
+    not_before = time.time() - grace
+    with _calls_lock:
+        call = _calls.get(key)
+        leader = call is None
+        if leader:
+            call = _calls[key] = _Call()
+
+    if not leader:
+        call.event.wait()
+        if call.error is not None:
+            raise call.error
+        return call.result
+
+    try:
+        call.result = _run_with_lease(key, fn, not_before)
+    except BaseException as e:
+        call.error = e
+        raise
+    finally:
+        with _calls_lock:
+            _calls.pop(key, None)
+        call.event.set()
+    return call.result
+
+
+def _run_with_lease(key, fn, not_before):
+    """取得跨 process 租約後執行 fn，若其他 worker 已在 not_before 之後產生結果則直接共用"""
+    directory = settings.SINGLE_FLIGHT_DIR
+    os.makedirs(directory, exist_ok=True)
+    digest = hashlib.sha256(key.encode('utf-8')).hexdigest()
+    result_path = os.path.join(directory, f'{digest}.json')
+    lock_path = os.path.join(directory, f'{digest}.lock')
+
+    found, value = _read_result(result_path, not_before)
+    if found:
+        return value
+
+    with _file_lease(lock_path):
+        # 等待租約期間，持有者可能已寫入結果
+        found, value = _read_result(result_path, not_before)
+        if found:
+            return value
+        value = fn()
+        _write_result(result_path, value)
+    _maybe_sweep(directory)
+    return value
+
+
+@contextmanager
+def _file_lease(lock_path):
+    """以 flock 取得獨佔租約；等待超過 SINGLE_FLIGHT_WAIT 秒則不再等待直接執行"""
+    if fcntl is None:
+        yield
+        return
+
+    with open(lock_path, 'a') as lock_file:
+        # 更新修改時間，讓清理程序只刪除閒置的鎖檔
+        os.utime(lock_path)
+        deadline = time.monotonic() + settings.SINGLE_FLIGHT_WAIT
+        acquired = False
+        while True:
+            try:
+                fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                acquired = True
+                break
+            except BlockingIOError:
+                if time.monotonic() >= deadline:
+                    break
+                time.sleep(0.05)
+        try:
+            yield
+        finally:
+            if acquired:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+def _read_result(result_path, not_before):
+    """讀取在 not_before 之後完成的共用結果，回傳 (是否存在, 值)"""
+    try:
+        with open(result_path, encoding='utf-8') as result_file:
+            data = json.load(result_file)
+        if data['finished_at'] < not_before:
+            return False, None
+        return True, data['value']
+    except (OSError, ValueError, KeyError, TypeError):
+        return False, None
+
+
+def _write_result(result_path, value):
+    """以暫存檔 + rename 原子寫入共用結果"""
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(result_path), suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'w', encoding='utf-8') as result_file:
+            json.dump({'value': value, 'finished_at': time.time()}, result_file, ensure_ascii=False)
+        os.replace(tmp_path, result_path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+_last_sweep = 0.0
+_sweep_lock = threading.Lock()
+
+
+def _maybe_sweep(directory):
+    """每個 process 至多每 SINGLE_FLIGHT_SWEEP_INTERVAL 秒清理一次共用目錄"""
+    global _last_sweep
+    now = time.monotonic()
+    with _sweep_lock:
+        if now - _last_sweep < settings.SINGLE_FLIGHT_SWEEP_INTERVAL:
+            return
+        _last_sweep = now
+    sweep(directory)
+
+
+def sweep(directory=None):
+    """刪除已不會再被讀取的結果檔與閒置的鎖檔，回傳刪除的檔案數
+
+    超過 SINGLE_FLIGHT_WAIT + SINGLE_FLIGHT_ANALYZE_GRACE 秒的檔案不可能再被等待者使用。
+    鎖檔需先取得鎖才刪除，避免刪掉正在使用中的租約。
+    """
+    directory = directory or settings.SINGLE_FLIGHT_DIR
+    max_age = settings.SINGLE_FLIGHT_WAIT + settings.SINGLE_FLIGHT_ANALYZE_GRACE
+    cutoff = time.time() - max_age
+    removed = 0
+    try:
+        entries = list(os.scandir(directory))
+    except FileNotFoundError:
+        return 0
+
+    for entry in entries:
+        try:
+            if entry.stat().st_mtime > cutoff:
+                continue
+            if entry.name.endswith('.lock') and fcntl is not None:
+                with open(entry.path, 'a') as lock_file:
+                    try:
+                        fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                    except BlockingIOError:
+                        continue
+                    os.remove(entry.path)
+            else:
+                os.remove(entry.path)
+            removed += 1
+        except OSError:
+            continue
+    return removed
@@ -0,0 +1,54 @@
+import importlib
+import time
+
+from django.conf import settings
+from django.db import connection
+
+# 處理請求時才會載入的重量級模組，預載時依序匯入
+HEAVY_MODULES = [
+    'PIL.Image',
+    'openai',
+    'analyzer.views',
+    'analyzer.admin',
+]
+
+
+def preload_modules():
+    """在 gunicorn master 中預先匯入重量級模組，讓 worker fork 後直接共用
+
+    回傳各模組的匯入耗時（毫秒）。
+    """
+    timings = {}
+    for module in HEAVY_MODULES:
+        start = time.perf_counter()
+        importlib.import_module(module)
+        timings[module] = (time.perf_counter() - start) * 1000
+    # 載入 URLconf，避免第一個請求才解析路由
+    from django.urls import get_resolver
+    get_resolver().url_patterns
+    return timings
+
+
+def warmup():
+    """預熱資料庫連線與各 OpenAI 後端的 client 連線池，回傳各項是否就緒"""
+    status = {}
+    
+    try:
+        connection.ensure_connection()
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT 1')
+        status['database'] = True
+    except Exception:
+        status['database'] = False
+    
+    if settings.OPENAI_BACKENDS:
+        from .providers import get_provider_pool
+        try:
+            get_provider_pool().warmup()
+            status['openai'] = True
+        except Exception:
+            status['openai'] = False
+    else:
+        status['openai'] = False
+    
+    return status
@@ -0,0 +1,86 @@
+import hashlib
+import os
+import time
+
+from django.conf import settings
+from django.core.files import File
+from django.core.files.storage import FileSystemStorage
+from django.utils.deconstruct import deconstructible
+
+
+@deconstructible(path='analyzer.storage.ContentAddressedStorage')
+class ContentAddressedStorage(FileSystemStorage):
+    """以內容雜湊命名檔案的儲存後端
+
+    相同內容的檔案只會儲存一份，路徑為 <upload_to 目錄>/ab/cd/<sha256>.<副檔名>，
+    以雜湊前綴分層避免單一目錄檔案過多。
+    """
+
+    hash_algorithm = 'sha256'
+    shard_depth = 2
+    shard_width = 2
+
+    def __init__(self, *args, **kwargs):
+        # 同名即同內容，併發寫入同一檔案時覆寫不會造成資料錯誤
+        kwargs.setdefault('allow_overwrite', True)
+        super().__init__(*args, **kwargs)
+
+    def content_hash(self, content):
+        """計算檔案內容雜湊"""
+        digest = hashlib.new(self.hash_algorithm)
+        for chunk in content.chunks():
+            digest.update(chunk)
+        if hasattr(content, 'seek'):
+            content.seek(0)
+        return digest.hexdigest()
+
+    def content_name(self, name, content):
+        """依內容雜湊產生儲存路徑，保留原目錄與副檔名"""
+        directory = os.path.dirname(name)
+        ext = os.path.splitext(name)[1].lower()
+        content_hash = self.content_hash(content)
+        shards = [
+            content_hash[i * self.shard_width:(i + 1) * self.shard_width]
+            for i in range(self.shard_depth)
+        ]
+        return os.path.join(directory, *shards, f"{content_hash}{ext}")
+
+    def save(self, name, content, max_length=None):
+        if name is None:
+            name = content.name
+        if not hasattr(content, 'chunks'):
+            content = File(content, name)
+        name = self.content_name(name, content)
+        return super().save(name, content, max_length=max_length)
+
+    def get_available_name(self, name, max_length=None):
+        # 內容定址的檔名不需要避開重名
+        return name
+
+    def _save(self, name, content):
+        # 已有相同內容的檔案時直接共用，不再寫入磁碟；
+        # 更新修改時間，讓孤兒檔案清理在寬限期內不會刪除剛被共用的檔案
+        if self.exists(name):
+            try:
+                os.utime(self.path(name))
+                return name
+            except FileNotFoundError:
+                pass
+        return super()._save(name, content)
+
+    def recently_used(self, name):
+        """檔案是否在 MEDIA_ORPHAN_GRACE 秒內寫入或被共用"""
+        try:
+            return time.time() - os.path.getmtime(self.path(name)) < settings.MEDIA_ORPHAN_GRACE
+        except FileNotFoundError:
+            return False
+
+
+image_storage = ContentAddressedStorage()
+
+
+def reference_count(name):
+    """計算仍參照此檔案的 ProductImage 筆數"""
+    from .models import ProductImage
+
+    return ProductImage.objects.filter(image=name).count()
@@ -1,3 +1,793 @@
-from django.test import TestCase
+import hashlib
+import io
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from unittest import mock
 
-# Create your tests here.
+import httpx
+import openai
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.exceptions import ValidationError
+from django.core.management import call_command
+from django.db import OperationalError, connection
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.http import QueryDict
+from django.test import Client, SimpleTestCase, TestCase, override_settings
+from PIL import Image
+
+from .admission import UpstreamBusy, _admitted, take_token, upstream_slot
+from .catalog import catalog_summary, filter_products
+from .forms import GatedImageField
+from .models import ApiClient, ProductImage
+from .providers import Backend, ProviderPool
+from .services import OpenAIService, analysis_version
+from .views import _apply_analysis
+from .singleflight import single_flight
+from .validators import validate_image_header
+
+
+class TempDirSettingsMixin:
+    """將 temp_dir_settings 列出的目錄設定指向每個測試專用的暫存目錄，測試結束後刪除"""
+
+    temp_dir_settings = ()
+
+    def setUp(self):
+        super().setUp()
+        directories = {}
+        for name in self.temp_dir_settings:
+            directory = tempfile.TemporaryDirectory()
+            self.addCleanup(directory.cleanup)
+            directories[name] = directory.name
+        override = override_settings(**directories)
+        override.enable()
+        self.addCleanup(override.disable)
+
+
+class SingleFlightTests(TempDirSettingsMixin, SimpleTestCase):
+    """請求合併（single-flight）測試"""
+
+    temp_dir_settings = ('SINGLE_FLIGHT_DIR',)
+
+    def test_concurrent_calls_share_one_upstream_call(self):
+        calls = []
+        started = threading.Event()
+
+        def fn():
+            calls.append(1)
+            started.set()
+            time.sleep(0.2)
+            return {'product_name': '牛番茄'}
+
+        results = []
+        threads = [
+            threading.Thread(target=lambda: results.append(single_flight('analyze:a', fn)))
+            for _ in range(5)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(results, [{'product_name': '牛番茄'}] * 5)
+
+    def test_completed_result_is_not_reused_without_grace(self):
+        counter = iter(range(1, 10))
+
+        self.assertEqual(single_flight('story:a', lambda: next(counter)), 1)
+        self.assertEqual(single_flight('story:a', lambda: next(counter)), 2)
+
+    def test_completed_result_is_reused_within_grace(self):
+        counter = iter(range(1, 10))
+
+        self.assertEqual(single_flight('analyze:b', lambda: next(counter), grace=30), 1)
+        self.assertEqual(single_flight('analyze:b', lambda: next(counter), grace=30), 1)
+
+    def test_failure_is_shared_with_waiters_but_not_kept(self):
+        calls = []
+        release = threading.Event()
+
+        def failing():
+            calls.append(1)
+            release.wait(1)
+            raise RuntimeError('upstream error')
+
+        errors = []
+
+        def run():
+            try:
+                single_flight('analyze:c', failing)
+            except RuntimeError as e:
+                errors.append(e)
+
+        threads = [threading.Thread(target=run) for _ in range(3)]
+        for thread in threads:
+            thread.start()
+        time.sleep(0.1)
+        release.set()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(len(errors), 3)
+
+        # 失敗後的新請求會重新呼叫上游
+        self.assertEqual(single_flight('analyze:c', lambda: 'ok', grace=30), 'ok')
+
+    def test_sweep_removes_only_expired_files(self):
+        single_flight('analyze:d', lambda: 'ok')
+        directory = settings.SINGLE_FLIGHT_DIR
+        stale = os.path.join(directory, 'stale.json')
+        with open(stale, 'w') as stale_file:
+            stale_file.write('{}')
+        past = time.time() - settings.SINGLE_FLIGHT_WAIT - settings.SINGLE_FLIGHT_ANALYZE_GRACE - 1
+        os.utime(stale, (past, past))
+
+        output = io.StringIO()
+        call_command('sweep_singleflight', stdout=output)
+
+        self.assertIn('已清理 1 個', output.getvalue())
+        self.assertFalse(os.path.exists(stale))
+        self.assertEqual(len(os.listdir(directory)), 2)
+
+
+def _raw_response(headers=None):
+    raw = mock.MagicMock()
+    raw.headers = headers or {}
+    raw.parse.return_value = 'ok'
+    return raw
+
+
+def _rate_limit_error():
+    request = httpx.Request('POST', 'https://api.example.com/v1/chat/completions')
+    return openai.RateLimitError('rate limited', response=httpx.Response(429, request=request), body=None)
+
+
+@override_settings(OPENAI_BACKEND_EJECT_SECONDS=30, OPENAI_BACKEND_MAX_EJECT_SECONDS=600, OPENAI_BACKEND_QUOTA_TTL=5)
+class ProviderPoolTests(SimpleTestCase):
+    """多後端池的挑選、剔除與配額恢復測試"""
+
+    def make_backend(self, name, **response):
+        backend = Backend(name, f'key-{name}')
+        backend._client = mock.MagicMock()
+        create = backend._client.chat.completions.with_raw_response.create
+        if 'error' in response:
+            create.side_effect = response['error']
+        else:
+            create.return_value = _raw_response(response.get('headers'))
+        return backend
+
+    def calls(self, backend):
+        return backend._client.chat.completions.with_raw_response.create.call_count
+
+    def test_failing_backend_is_ejected_and_call_retried_elsewhere(self):
+        a = self.make_backend('a', error=_rate_limit_error())
+        b = self.make_backend('b')
+        pool = ProviderPool([a, b])
+
+        self.assertEqual(pool.chat_completion(model='gpt-4o'), 'ok')
+        for _ in range(5):
+            pool.chat_completion(model='gpt-4o')
+
+        self.assertEqual(self.calls(a), 1)
+        self.assertEqual(self.calls(b), 6)
+        self.assertFalse(a.is_healthy(time.monotonic()))
+
+    def test_ejection_doubles_on_consecutive_failures(self):
+        a = self.make_backend('a', error=_rate_limit_error())
+        pool = ProviderPool([a])
+
+        for expected in (30, 60):
+            with self.assertRaises(openai.RateLimitError):
+                pool.chat_completion(model='gpt-4o')
+            self.assertAlmostEqual(a.ejected_until - time.monotonic(), expected, delta=1)
+
+    def test_request_errors_do_not_eject_backend(self):
+        request = httpx.Request('POST', 'https://api.example.com/v1/chat/completions')
+        bad_request = openai.BadRequestError('bad', response=httpx.Response(400, request=request), body=None)
+        a = self.make_backend('a', error=bad_request)
+        b = self.make_backend('b')
+        pool = ProviderPool([a, b])
+        a.latency_ms, b.latency_ms = 1, 2
+
+        with self.assertRaises(openai.BadRequestError):
+            pool.chat_completion(model='gpt-4o')
+        self.assertTrue(a.is_healthy(time.monotonic()))
+        self.assertEqual(self.calls(b), 0)
+
+    def test_exhausted_quota_recovers_after_reset(self):
+        a = self.make_backend('a', headers={
+            'x-ratelimit-remaining-requests': '0',
+            'x-ratelimit-reset-requests': '2s',
+        })
+        b = self.make_backend('b')
+        pool = ProviderPool([a, b])
+        a.latency_ms, b.latency_ms = 1, 2
+
+        pool.chat_completion(model='gpt-4o')
+        self.assertEqual(self.calls(a), 1)
+        for _ in range(3):
+            pool.chat_completion(model='gpt-4o')
+        self.assertEqual(self.calls(a), 1)
+
+        # 超過重置時間後，舊的 0 讀數不再生效
+        with mock.patch('analyzer.providers.time.monotonic', return_value=time.monotonic() + 3):
+            self.assertIsNone(a.quota_remaining(time.monotonic()))
+            pool.chat_completion(model='gpt-4o')
+        self.assertEqual(self.calls(a), 2)
+
+    def test_quota_reading_without_reset_header_expires(self):
+        a = self.make_backend('a', headers={'x-ratelimit-remaining-requests': '0'})
+        pool = ProviderPool([a])
+        pool.chat_completion(model='gpt-4o')
+
+        now = time.monotonic()
+        self.assertEqual(a.quota_remaining(now), 0)
+        self.assertIsNone(a.quota_remaining(now + 6))
+
+
+@override_settings(
+    ADMISSION_RATE=0.5,
+    ADMISSION_BURST=3,
+    ADMISSION_API_KEYS={'issued-key'},
+    ADMISSION_PROXY_COUNT=0,
+    ADMISSION_MAX_CONCURRENT=1,
+    ADMISSION_QUEUE_TIMEOUT=0.1,
+)
+class AdmissionControlTests(TempDirSettingsMixin, TestCase):
+    """API 入口控管（token bucket 限流）測試"""
+
+    temp_dir_settings = ('ADMISSION_SLOT_DIR',)
+
+    def post_story(self, **headers):
+        return self.client.post('/api/generate-story/', data='{}', content_type='application/json', **headers)
+
+    def test_burst_then_throttled(self):
+        for _ in range(3):
+            self.assertEqual(take_token('ip:10.0.0.1'), 0)
+        # 額度用完後需等待約 1 / 0.5 = 2 秒
+        self.assertEqual(take_token('ip:10.0.0.1'), 2)
+
+        client = ApiClient.objects.get(client_id='ip:10.0.0.1')
+        self.assertEqual(client.total_requests, 3)
+        self.assertEqual(client.throttled_requests, 1)
+
+    def test_tokens_refill_over_time(self):
+        for _ in range(3):
+            take_token('ip:10.0.0.2')
+        self.assertGreater(take_token('ip:10.0.0.2'), 0)
+
+        # 模擬經過 4 秒：補充 2 個額度
+        ApiClient.objects.filter(client_id='ip:10.0.0.2').update(last_refill=time.time() - 4)
+        self.assertEqual(take_token('ip:10.0.0.2'), 0)
+        self.assertEqual(take_token('ip:10.0.0.2'), 0)
+        self.assertGreater(take_token('ip:10.0.0.2'), 0)
+
+    def test_view_returns_429_with_retry_after(self):
+        for _ in range(3):
+            self.assertEqual(self.post_story().status_code, 400)
+
+        response = self.post_story()
+        self.assertEqual(response.status_code, 429)
+        self.assertEqual(response['Retry-After'], '2')
+        self.assertFalse(response.json()['success'])
+
+    def test_unissued_api_keys_share_the_ip_bucket(self):
+        statuses = [self.post_story(HTTP_X_API_KEY=f'rand{i}').status_code for i in range(5)]
+
+        self.assertEqual(statuses.count(429), 2)
+        self.assertEqual(list(ApiClient.objects.values_list('client_id', flat=True)), ['ip:127.0.0.1'])
+
+    def test_issued_api_key_has_its_own_bucket(self):
+        for _ in range(3):
+            self.post_story()
+        self.assertEqual(self.post_story().status_code, 429)
+        self.assertEqual(self.post_story(HTTP_X_API_KEY='issued-key').status_code, 400)
+
+
+def _completion(content='ok'):
+    response = mock.MagicMock()
+    response.choices[0].message.content = content
+    return response
+
+
+@override_settings(ADMISSION_MAX_CONCURRENT=1, ADMISSION_QUEUE_TIMEOUT=0.1, ADMISSION_RETRY_AFTER=10)
+class UpstreamSlotTests(TempDirSettingsMixin, TestCase):
+    """全域上游名額只由實際呼叫上游的 single-flight leader 佔用"""
+
+    temp_dir_settings = ('ADMISSION_SLOT_DIR', 'SINGLE_FLIGHT_DIR')
+
+    def setUp(self):
+        super().setUp()
+        patcher = mock.patch('analyzer.services.get_provider_pool')
+        self.pool = patcher.start().return_value
+        self.pool.chat_completion.return_value = _completion()
+        self.addCleanup(patcher.stop)
+
+    def admitted_call(self, results):
+        token = _admitted.set(True)
+        try:
+            results.append(OpenAIService()._complete('story', model='gpt-4o'))
+        except UpstreamBusy:
+            results.append('busy')
+        finally:
+            _admitted.reset(token)
+
+    def test_waiting_followers_do_not_need_a_slot(self):
+        started, release = threading.Event(), threading.Event()
+
+        def slow_completion(**request):
+            started.set()
+            release.wait(2)
+            return _completion()
+
+        self.pool.chat_completion.side_effect = slow_completion
+        results = []
+        leader = threading.Thread(target=self.admitted_call, args=(results,))
+        leader.start()
+        started.wait(1)
+        follower = threading.Thread(target=self.admitted_call, args=(results,))
+        follower.start()
+        # follower 等待超過排隊時間也不會因為名額被 leader 佔用而被拒絕
+        time.sleep(0.3)
+        release.set()
+        leader.join()
+        follower.join()
+
+        self.assertEqual(results, ['ok', 'ok'])
+        self.assertEqual(self.pool.chat_completion.call_count, 1)
+
+    def test_busy_slot_returns_503(self):
+        product = ProductImage.objects.create(image='uploads/a.jpg', analyzed=True, analysis_json={'product_name': '牛番茄'})
+
+        with upstream_slot() as acquired:
+            self.assertTrue(acquired)
+            response = self.client.post('/api/generate-story/', data={
+                'product_id': product.pk, 'story_prompt': '故事', 'story_style': '現代簡約',
+            }, content_type='application/json')
+
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(response['Retry-After'], '10')
+        self.assertEqual(ApiClient.objects.get().rejected_requests, 1)
+        product.refresh_from_db()
+        self.assertFalse(product.story_generated)
+        self.pool.chat_completion.assert_not_called()
+
+    def test_calls_outside_admission_control_are_not_limited(self):
+        with upstream_slot():
+            self.assertEqual(OpenAIService()._complete('story', model='gpt-4o'), 'ok')
+
+
+class ProductApiTests(TestCase):
+    """商品 API 的條件式請求與游標分頁測試"""
+
+    def setUp(self):
+        self.products = [
+            ProductImage.objects.create(image=f'uploads/{i}.jpg', product_name=f'商品{i}', recommended_price=100 * i)
+            for i in range(1, 6)
+        ]
+
+    def test_save_increments_version_in_database(self):
+        product = self.products[0]
+        product.product_name = '新名稱'
+        product.save()
+        product.save(update_fields=['product_name'])
+
+        self.assertEqual(product.version, 3)
+        self.assertEqual(ProductImage.objects.get(pk=product.pk).version, 3)
+
+    def test_detail_returns_304_for_matching_etag(self):
+        url = f'/api/products/{self.products[0].pk}/'
+        etag = self.client.get(url)['ETag']
+
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+
+    def test_detail_etag_changes_after_save(self):
+        url = f'/api/products/{self.products[0].pk}/'
+        etag = self.client.get(url)['ETag']
+
+        self.products[0].save()
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+
+    def test_list_returns_304_until_page_changes(self):
+        etag = self.client.get('/api/products/?limit=2')['ETag']
+        self.assertEqual(self.client.get('/api/products/?limit=2', HTTP_IF_NONE_MATCH=etag).status_code, 304)
+
+        self.products[-1].save()
+        self.assertEqual(self.client.get('/api/products/?limit=2', HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+    def test_next_cursor_walks_all_products(self):
+        seen = []
+        url = '/api/products/?limit=2&fields=id'
+        while url:
+            data = self.client.get(url).json()['data']
+            seen.extend(item['id'] for item in data['results'])
+            cursor = data['next_cursor']
+            url = f'/api/products/?limit=2&fields=id&cursor={cursor}' if cursor else None
+
+        self.assertEqual(seen, sorted((p.pk for p in self.products), reverse=True))
+
+    def test_fields_projection(self):
+        data = self.client.get(f'/api/products/{self.products[0].pk}/?fields=id,product_name').json()['data']
+        self.assertEqual(data, {'id': self.products[0].pk, 'product_name': '商品1'})
+
+    def test_invalid_parameters_return_400(self):
+        for query in ('cursor=not-a-cursor', 'fields=secret', 'min_price=abc'):
+            with self.subTest(query=query):
+                response = self.client.get(f'/api/products/?{query}')
+                self.assertEqual(response.status_code, 400)
+                self.assertFalse(response.json()['success'])
+
+
+def _image_file(name='photo.png', image_format='PNG', size=(64, 64)):
+    """產生測試用圖片；以隨機像素避免壓縮後過小"""
+    image = Image.frombytes('RGB', size, os.urandom(size[0] * size[1] * 3))
+    buffer = io.BytesIO()
+    image.save(buffer, format=image_format)
+    return SimpleUploadedFile(name, buffer.getvalue(), content_type=f'image/{image_format.lower()}')
+
+
+@override_settings(UPLOAD_MAX_BYTES=1024 * 1024, UPLOAD_MAX_PIXELS=10_000, UPLOAD_ALLOWED_FORMATS=['JPEG', 'PNG'])
+class UploadGateTests(SimpleTestCase):
+    """上傳閘門：檔頭檢查與表單欄位測試"""
+
+    def assertRejected(self, file, code):
+        with self.assertRaises(ValidationError) as cm:
+            validate_image_header(file)
+        self.assertEqual(cm.exception.code, code)
+
+    def test_accepts_allowed_image(self):
+        file = _image_file()
+        validate_image_header(file)
+        self.assertEqual(file.tell(), 0)
+
+    def test_rejects_unsupported_format(self):
+        self.assertRejected(_image_file('photo.bmp', 'BMP'), 'unsupported_format')
+
+    def test_rejects_too_many_pixels(self):
+        self.assertRejected(_image_file(size=(200, 100)), 'too_many_pixels')
+
+    def test_rejects_too_many_bytes(self):
+        with self.settings(UPLOAD_MAX_BYTES=100):
+            self.assertRejected(_image_file(), 'file_too_large')
+
+    def test_rejects_non_image(self):
+        self.assertRejected(SimpleUploadedFile('photo.png', b'not an image'), 'invalid_image')
+
+    def test_gated_field_runs_header_check_before_pillow(self):
+        field = GatedImageField()
+        self.assertEqual(field.clean(_image_file()).name, 'photo.png')
+        with self.assertRaises(ValidationError):
+            field.clean(_image_file('photo.bmp', 'BMP'))
+
+
+@override_settings(UPLOAD_MAX_BYTES=1000, DATA_UPLOAD_MAX_MEMORY_SIZE=1000)
+class UploadSizeLimitTests(TestCase):
+    """過大上傳在寫入磁碟與呼叫 OpenAI 之前以 413 拒絕"""
+
+    def test_oversized_content_length_returns_413_before_csrf(self):
+        client = Client(enforce_csrf_checks=True)
+        response = client.post('/upload/', {'image': _image_file(size=(64, 64))})
+
+        self.assertEqual(response.status_code, 413)
+        self.assertTemplateUsed(response, 'analyzer/upload.html')
+
+    def test_oversized_api_request_returns_json_413(self):
+        response = self.client.post('/api/analyze/', {'image': _image_file(size=(64, 64))})
+
+        self.assertEqual(response.status_code, 413)
+        self.assertFalse(response.json()['success'])
+
+    def test_stream_is_aborted_once_file_exceeds_limit(self):
+        # Content-Length 在上限內（由欄位上限放寬），實際檔案內容超過 UPLOAD_MAX_BYTES
+        with self.settings(DATA_UPLOAD_MAX_MEMORY_SIZE=100_000), \
+                mock.patch('analyzer.views.OpenAIService') as service:
+            page = self.client.post('/upload/', {'image': _image_file(size=(64, 64))})
+            api = self.client.post('/api/analyze/', {'image': _image_file(size=(64, 64))})
+
+        self.assertEqual(page.status_code, 413)
+        self.assertEqual(api.status_code, 413)
+        self.assertIn('檔案超過大小上限', api.json()['error'])
+        service.assert_not_called()
+        self.assertFalse(ProductImage.objects.exists())
+
+    def test_invalid_image_returns_400(self):
+        response = self.client.post('/upload/', {'image': SimpleUploadedFile('photo.png', b'not an image')})
+
+        self.assertEqual(response.status_code, 400)
+
+
+def _product(category='水果', features=(), scenarios=(), price=None, **analysis):
+    return ProductImage.objects.create(
+        image='uploads/p.jpg',
+        recommended_price=price,
+        analysis_json={'category': category, 'features': list(features), 'usage_scenarios': list(scenarios), **analysis},
+    )
+
+
+class CatalogTests(TestCase):
+    """分類表同步、篩選與統計測試"""
+
+    def names(self, related):
+        return sorted(related.values_list('name', flat=True))
+
+    def test_save_syncs_catalog_and_skips_placeholders(self):
+        product = _product(features=['甜', ' 甜 ', '', '未知'], scenarios=['早餐'], target_audience='未知')
+
+        self.assertEqual(product.category.name, '水果')
+        self.assertEqual(self.names(product.features), ['甜'])
+        self.assertEqual(self.names(product.usage_scenarios), ['早餐'])
+        self.assertEqual(product.target_audience, '')
+        self.assertIsNone(_product(category='錯誤').category)
+
+    def test_save_resyncs_only_when_analysis_changes(self):
+        product = ProductImage.objects.get(pk=_product(features=['甜']).pk)
+        product.features.clear()
+        product.product_name = '牛番茄'
+        product.save()
+        self.assertEqual(self.names(product.features), [])
+
+        product.analysis_json = {**product.analysis_json, 'features': ['多汁']}
+        product.save(update_fields=['analysis_json'])
+        self.assertEqual(self.names(product.features), ['多汁'])
+
+    def test_backfill_catalog(self):
+        product = ProductImage.objects.create(image='uploads/p.jpg')
+        ProductImage.objects.filter(pk=product.pk).update(
+            analysis_json={'category': '蔬菜', 'features': ['有機'], 'target_audience': '家庭'}
+        )
+
+        call_command('backfill_catalog', stdout=io.StringIO())
+
+        product = ProductImage.objects.get(pk=product.pk)
+        self.assertEqual(product.category.name, '蔬菜')
+        self.assertEqual(product.target_audience, '家庭')
+        self.assertEqual(self.names(product.features), ['有機'])
+        self.assertEqual(product.version, 2)
+
+    def test_repeated_feature_filters_are_and_ed(self):
+        both = _product(features=['甜', '耐放'])
+        _product(features=['甜'])
+
+        queryset = filter_products(ProductImage.objects.all(), QueryDict('feature=甜&feature=耐放'))
+        self.assertEqual(list(queryset), [both])
+
+    def test_price_percentiles_and_facets(self):
+        for price in range(10, 101, 10):
+            _product(features=['甜'] if price <= 30 else ['耐放'], price=price)
+        _product(category='蔬菜', price=25)
+
+        summary = catalog_summary(QueryDict())
+        categories = {row['name']: row for row in summary['categories']}
+        self.assertEqual(categories['水果']['product_count'], 10)
+        self.assertEqual(categories['水果']['price_percentiles'], {'p25': 30, 'p50': 50, 'p75': 80, 'p90': 90})
+        self.assertEqual(categories['蔬菜']['price_percentiles'], {'p25': 25, 'p50': 25, 'p75': 25, 'p90': 25})
+        self.assertEqual(summary['facets']['features'], [{'name': '耐放', 'count': 7}, {'name': '甜', 'count': 3}])
+
+        filtered = catalog_summary(QueryDict('feature=甜&max_price=20'))
+        self.assertEqual(filtered['categories'][0]['product_count'], 2)
+
+    def test_api_exposes_catalog_fields(self):
+        product = _product(features=['甜'], scenarios=['早餐'], target_audience='家庭')
+
+        response = self.client.get(f'/api/products/{product.pk}/?fields=category,target_audience,features,usage_scenarios')
+        self.assertEqual(response.json()['data'], {
+            'category': '水果',
+            'target_audience': '家庭',
+            'features': ['甜'],
+            'usage_scenarios': ['早餐'],
+        })
+        self.assertEqual(self.client.get('/api/products/?feature=早餐').json()['data']['results'], [])
+
+
+@override_settings(MEDIA_ORPHAN_GRACE=3600)
+class ContentAddressedStorageTests(TempDirSettingsMixin, TestCase):
+    """內容定址儲存、參照計數釋放與孤兒檔案清理測試"""
+
+    temp_dir_settings = ('MEDIA_ROOT',)
+
+    def setUp(self):
+        super().setUp()
+        self.data = _image_file().read()
+        digest = hashlib.sha256(self.data).hexdigest()
+        self.name = f'uploads/{digest[:2]}/{digest[2:4]}/{digest}.png'
+
+    def upload(self):
+        return ProductImage.objects.create(image=SimpleUploadedFile('Photo.PNG', self.data))
+
+    def path(self):
+        return ProductImage._meta.get_field('image').storage.path(self.name)
+
+    def age(self, seconds=7200):
+        past = time.time() - seconds
+        os.utime(self.path(), (past, past))
+
+    def test_identical_uploads_share_one_file(self):
+        first, second = self.upload(), self.upload()
+
+        self.assertEqual(first.image.name, self.name)
+        self.assertEqual(second.image.name, self.name)
+        self.assertEqual(os.listdir(os.path.dirname(self.path())), [os.path.basename(self.name)])
+
+    def test_reuse_refreshes_mtime(self):
+        self.upload()
+        self.age()
+        self.upload()
+
+        self.assertLess(time.time() - os.path.getmtime(self.path()), 60)
+
+    def test_delete_releases_file_after_last_reference(self):
+        first, second = self.upload(), self.upload()
+        self.age()
+
+        with self.captureOnCommitCallbacks(execute=True):
+            first.delete()
+        self.assertTrue(os.path.exists(self.path()))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            second.delete()
+        self.assertFalse(os.path.exists(self.path()))
+
+    def test_delete_keeps_recently_used_file(self):
+        product = self.upload()
+
+        with self.captureOnCommitCallbacks(execute=True):
+            product.delete()
+        self.assertTrue(os.path.exists(self.path()))
+
+    def test_gc_media_removes_old_orphans_only(self):
+        product = self.upload()
+        ProductImage.objects.filter(pk=product.pk).delete()
+
+        output = io.StringIO()
+        call_command('gc_media', stdout=output)
+        self.assertTrue(os.path.exists(self.path()))
+
+        call_command('gc_media', '--dry-run', '--min-age=0', stdout=output)
+        self.assertIn(f'將刪除：{self.name}', output.getvalue())
+        self.assertTrue(os.path.exists(self.path()))
+
+        call_command('gc_media', '--min-age=0', stdout=output)
+        self.assertFalse(os.path.exists(self.path()))
+
+    def test_gc_media_keeps_referenced_files(self):
+        self.upload()
+        self.age()
+
+        call_command('gc_media', '--min-age=0', stdout=io.StringIO())
+        self.assertTrue(os.path.exists(self.path()))
+
+
+class ReanalyzeStaleTests(TestCase):
+    """分析版本標記與過期分析結果重新分析指令測試"""
+
+    def setUp(self):
+        self.prompt_hash, self.model = analysis_version()
+        patcher = mock.patch.object(OpenAIService, 'analyze_product_image', autospec=True)
+        self.analyze = patcher.start()
+        self.analyze.side_effect = lambda service, path: {'product_name': f'新{os.path.basename(path)}'}
+        self.addCleanup(patcher.stop)
+
+    def make(self, name, prompt_hash='old', model='gpt-4-vision', view_count=0, analyzed=True):
+        return ProductImage.objects.create(
+            image=f'uploads/{name}.jpg',
+            product_name=name,
+            analyzed=analyzed,
+            analysis_prompt_hash=prompt_hash,
+            analysis_model=model,
+            view_count=view_count,
+        )
+
+    def reanalyze(self, *args):
+        output = io.StringIO()
+        call_command('reanalyze_stale', *args, stdout=output)
+        return [os.path.basename(call.args[1]) for call in self.analyze.call_args_list], output.getvalue()
+
+    def test_apply_analysis_stamps_current_version(self):
+        product = self.make('a', prompt_hash='', model='')
+
+        _apply_analysis(product, {'product_name': '牛番茄'})
+        self.assertEqual((product.analysis_prompt_hash, product.analysis_model), (self.prompt_hash, self.model))
+
+    def test_failed_analysis_is_not_stamped(self):
+        product = self.make('a', prompt_hash='', model='')
+
+        _apply_analysis(product, {'product_name': '分析錯誤', 'error': 'timeout'})
+        self.assertEqual((product.analysis_prompt_hash, product.analysis_model), ('', ''))
+
+    def test_only_stale_analyses_are_reanalyzed(self):
+        self.make('current', prompt_hash=self.prompt_hash, model=self.model)
+        self.make('old-prompt', model=self.model)
+        self.make('old-model', prompt_hash=self.prompt_hash)
+        self.make('unanalyzed', analyzed=False)
+
+        called, _ = self.reanalyze('--order=newest')
+
+        self.assertEqual(sorted(called), ['old-model.jpg', 'old-prompt.jpg'])
+        product = ProductImage.objects.get(image='uploads/old-prompt.jpg')
+        self.assertEqual(product.product_name, '新old-prompt.jpg')
+        self.assertEqual((product.analysis_prompt_hash, product.analysis_model), (self.prompt_hash, self.model))
+
+    def test_priority_order(self):
+        self.make('few', view_count=1)
+        self.make('many', view_count=10)
+        self.make('newest', view_count=0)
+
+        self.assertEqual(self.reanalyze('--limit=2')[0], ['many.jpg', 'few.jpg'])
+        self.analyze.reset_mock()
+        ProductImage.objects.update(analysis_prompt_hash='old')
+        self.assertEqual(self.reanalyze('--limit=1', '--order=newest')[0], ['newest.jpg'])
+
+    def test_time_budget_stops_before_next_call(self):
+        self.make('a')
+
+        called, output = self.reanalyze('--max-seconds=0')
+        self.assertEqual(called, [])
+        self.assertIn('已達時間上限', output)
+
+    def test_failure_keeps_previous_result(self):
+        product = self.make('a')
+        self.analyze.side_effect = lambda service, path: {'product_name': '分析錯誤', 'error': 'timeout'}
+
+        _, output = self.reanalyze()
+
+        product.refresh_from_db()
+        self.assertEqual((product.product_name, product.analysis_prompt_hash), ('a', 'old'))
+        self.assertIn('失敗 1 筆', output)
+
+
+class HealthzTests(TestCase):
+    """健康檢查與後端池狀態端點測試"""
+
+    def test_ready_returns_200_without_backend_stats(self):
+        response = self.client.get('/healthz/')
+
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.json()['data']['database'])
+        self.assertNotIn('backends', response.json()['data'])
+
+    def test_database_unavailable_returns_503(self):
+        with mock.patch.object(connection, 'ensure_connection', side_effect=OperationalError):
+            response = self.client.get('/healthz/')
+
+        self.assertEqual(response.status_code, 503)
+        self.assertFalse(response.json()['success'])
+
+    def test_backend_status_is_staff_only(self):
+        self.assertEqual(self.client.get('/backends/').status_code, 302)
+
+        self.client.force_login(User.objects.create_user('staff', is_staff=True))
+        response = self.client.get('/backends/')
+        self.assertEqual(response.status_code, 200)
+        self.assertIsInstance(response.json()['data']['backends'], list)
+
+
+class LazyImportTests(SimpleTestCase):
+    """延遲匯入模式：載入 WSGI 應用程式時不匯入重量級模組"""
+
+    def loaded_heavy_modules(self, lazy_imports):
+        code = (
+            'import sys\n'
+            'from product_analyzer.wsgi import application\n'
+            'print(",".join(name for name in ("openai", "PIL") if name in sys.modules))\n'
+        )
+        env = {**os.environ, 'DJANGO_SETTINGS_MODULE': 'product_analyzer.settings', 'LAZY_IMPORTS': lazy_imports}
+        result = subprocess.run(
+            [sys.executable, '-c', code],
+            cwd=settings.BASE_DIR, env=env, capture_output=True, text=True, check=True,
+        )
+        return result.stdout.splitlines()[-1]
+
+    def test_lazy_imports_keep_heavy_modules_unloaded(self):
+        self.assertEqual(self.loaded_heavy_modules('True'), '')
+
+    def test_preload_imports_heavy_modules(self):
+        self.assertEqual(self.loaded_heavy_modules('False'), 'openai,PIL')
@@ -0,0 +1,37 @@
+from django.conf import settings
+from django.template.defaultfilters import filesizeformat
+from django.core.files.uploadhandler import FileUploadHandler, StopUpload
+
+
+class UploadSizeLimitHandler(FileUploadHandler):
+    """上傳大小閘門：超過 UPLOAD_MAX_BYTES 時立即中止，不再寫入記憶體或暫存檔
+
+    必須排在 FILE_UPLOAD_HANDLERS 的第一位，才能在其他 handler 收到資料前攔截。
+    被拒絕時會在 request.upload_rejected 留下原因，供視圖回傳 413。
+    """
+
+    def handle_raw_input(self, input_data, META, content_length, boundary, encoding=None):
+        self.limit = settings.UPLOAD_MAX_BYTES
+        self.received = 0
+        # Content-Length 已超過上限的請求由 UploadSizeLimitMiddleware 直接回傳 413
+        return None
+
+    def new_file(self, *args, **kwargs):
+        super().new_file(*args, **kwargs)
+        self.received = 0
+
+    def receive_data_chunk(self, raw_data, start):
+        self.received += len(raw_data)
+        if self.received > self.limit:
+            self._reject()
+            raise StopUpload(connection_reset=True)
+        return raw_data
+
+    def file_complete(self, file_size):
+        return None
+
+    def _reject(self):
+        if self.request is not None:
+            self.request.upload_rejected = (
+                f'檔案超過大小上限 {filesizeformat(self.limit)}'
+            )
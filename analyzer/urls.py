@@ -8,7 +8,12 @@ urlpatterns = [
     path('upload/', views.upload_image, name='upload'),
     path('result/<int:pk>/', views.result, name='result'),
     path('history/', views.history, name='history'),
+    path('healthz/', views.healthz, name='healthz'),
+    path('backends/', views.backend_status, name='backend_status'),
     path('generate-story/<int:pk>/', views.generate_story, name='generate_story'),
     path('api/analyze/', views.api_analyze, name='api_analyze'),
     path('api/generate-story/', views.api_generate_story, name='api_generate_story'),
+    path('api/products/', views.api_product_list, name='api_product_list'),
+    path('api/products/<int:pk>/', views.api_product_detail, name='api_product_detail'),
+    path('api/catalog/', views.api_catalog, name='api_catalog'),
 ]
\ No newline at end of file
@@ -0,0 +1,46 @@
+from django.conf import settings
+from django.template.defaultfilters import filesizeformat
+from django.core.exceptions import ValidationError
+
+
+def validate_image_header(file):
+    """僅讀取檔頭檢查圖片格式、位元組數與像素數，不解碼整張圖片
+
+    於 Pillow 完整驗證與儲存前執行，可在不耗費磁碟與記憶體的情況下拒絕
+    過大檔案、不支援的格式與解壓縮炸彈。
+    """
+    # 延遲匯入 PIL，避免影響冷啟動
+    from PIL import Image
+
+    size = getattr(file, 'size', None)
+    if size is not None and size > settings.UPLOAD_MAX_BYTES:
+        raise ValidationError(
+            f'檔案超過大小上限 {filesizeformat(settings.UPLOAD_MAX_BYTES)}',
+            code='file_too_large',
+        )
+
+    position = file.tell() if hasattr(file, 'tell') else 0
+    try:
+        # Image.open 只解析檔頭，不會解碼像素資料
+        with Image.open(file) as image:
+            image_format = image.format
+            width, height = image.size
+    except Image.DecompressionBombError:
+        raise ValidationError('圖片像素數過大', code='too_many_pixels')
+    except Exception:
+        raise ValidationError('無法辨識的圖片檔案', code='invalid_image')
+    finally:
+        if hasattr(file, 'seek'):
+            file.seek(position)
+
+    if image_format not in settings.UPLOAD_ALLOWED_FORMATS:
+        raise ValidationError(
+            f'不支援的圖片格式：{image_format}',
+            code='unsupported_format',
+        )
+
+    if width * height > settings.UPLOAD_MAX_PIXELS:
+        raise ValidationError(
+            f'圖片像素數過大（{width}x{height}）',
+            code='too_many_pixels',
+        )
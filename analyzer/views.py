@@ -1,14 +1,22 @@
 from django.shortcuts import render, redirect, get_object_or_404
 from django.contrib import messages
+from django.contrib.admin.views.decorators import staff_member_required
+from django.db.models import F
 from django.http import JsonResponse
 from django.views.decorators.csrf import csrf_exempt
-from django.views.decorators.http import require_http_methods
+from django.views.decorators.http import require_http_methods, condition
+import base64
+import hashlib
 import json
 import os
 
+from .admission import UpstreamBusy, admission_control
+from .catalog import catalog_summary, filter_products
 from .models import ProductImage
 from .forms import ProductImageForm, StoryGenerationForm
-from .services import OpenAIService
+from .providers import get_provider_pool
+from .services import OpenAIService, analysis_version, is_failed_analysis
+from .startup import warmup
 
 def index(request):
     """首頁視圖"""
@@ -17,6 +25,13 @@ def index(request):
         'recent_images': recent_images
     })
 
+def _apply_analysis(product_image, analysis_result):
+    """套用分析結果；失敗的結果不標記版本，讓重新分析程序之後重試"""
+    if is_failed_analysis(analysis_result):
+        product_image.apply_analysis(analysis_result)
+    else:
+        product_image.apply_analysis(analysis_result, *analysis_version())
+
 def upload_image(request):
     """上傳圖片視圖"""
     if request.method == 'POST':
@@ -32,23 +47,7 @@ def upload_image(request):
                 analysis_result = openai_service.analyze_product_image(image_path)
                 
                 # 更新模型資料
-                product_image.product_name = analysis_result.get('product_name', '')
-                product_image.description = analysis_result.get('description', '')
-                
-                # 安全處理價格
-                try:
-                    price = analysis_result.get('recommended_price', 0)
-                    if isinstance(price, str):
-                        import re
-                        price_str = re.sub(r'[^\d.]', '', price)
-                        product_image.recommended_price = float(price_str) if price_str else 0
-                    else:
-                        product_image.recommended_price = float(price) if price else 0
-                except (ValueError, TypeError):
-                    product_image.recommended_price = 0
-                
-                product_image.analysis_json = analysis_result
-                product_image.analyzed = True
+                _apply_analysis(product_image, analysis_result)
                 product_image.save()
                 
                 messages.success(request, '圖片上傳並分析成功！')
@@ -57,18 +56,49 @@ def upload_image(request):
             except Exception as e:
                 messages.error(request, f'圖片分析失敗: {str(e)}')
                 return redirect('analyzer:upload')
+        elif getattr(request, 'upload_rejected', None):
+            messages.error(request, f'圖片上傳失敗：{request.upload_rejected}')
+            return render(request, 'analyzer/upload.html', {'form': form}, status=413)
+        elif form.has_error('image', 'file_too_large'):
+            messages.error(request, f'圖片上傳失敗：{form.errors["image"][0]}')
+            return render(request, 'analyzer/upload.html', {'form': form}, status=413)
         else:
             messages.error(request, '圖片上傳失敗，請檢查檔案格式。')
+            return render(request, 'analyzer/upload.html', {'form': form}, status=400)
     else:
         form = ProductImageForm()
     
     return render(request, 'analyzer/upload.html', {'form': form})
 
+@require_http_methods(["GET", "HEAD"])
+def healthz(request):
+    """健康檢查與預熱端點：建立資料庫連線並初始化 OpenAI client（公開端點，只回報是否就緒）"""
+    status = warmup()
+    return JsonResponse({
+        'success': status['database'],
+        'data': status
+    }, status=200 if status['database'] else 503)
+
+@staff_member_required
+@require_http_methods(["GET", "HEAD"])
+def backend_status(request):
+    """OpenAI 後端池狀態（僅限管理員）
+
+    每個 worker 各自維護後端池，回傳的是處理此請求的 worker 所見的狀態。
+    """
+    return JsonResponse({
+        'success': True,
+        'data': {'backends': get_provider_pool().stats()}
+    })
+
 def result(request, pk):
     """結果顯示視圖"""
     product_image = get_object_or_404(ProductImage, pk=pk)
     story_form = StoryGenerationForm()
     
+    # 累計瀏覽次數（供重新分析排序），不視為內容變更
+    ProductImage.objects.filter(pk=pk).update(view_count=F('view_count') + 1)
+    
     return render(request, 'analyzer/result.html', {
         'product_image': product_image,
         'story_form': story_form
@@ -83,10 +113,17 @@ def history(request):
 
 @csrf_exempt
 @require_http_methods(["POST"])
+@admission_control
 def api_analyze(request):
     """API 端點：分析圖片"""
     try:
         if 'image' not in request.FILES:
+            # 上傳閘門中止時 request.FILES 為空
+            if getattr(request, 'upload_rejected', None):
+                return JsonResponse({
+                    'success': False,
+                    'error': request.upload_rejected
+                }, status=413)
             return JsonResponse({
                 'success': False,
                 'error': '沒有上傳圖片'
@@ -100,26 +137,15 @@ def api_analyze(request):
             # 分析圖片
             openai_service = OpenAIService()
             image_path = product_image.image.path
-            analysis_result = openai_service.analyze_product_image(image_path)
+            try:
+                analysis_result = openai_service.analyze_product_image(image_path)
+            except UpstreamBusy:
+                # 未取得上游名額，不留下未分析的資料
+                product_image.delete()
+                raise
             
             # 更新模型資料
-            product_image.product_name = analysis_result.get('product_name', '')
-            product_image.description = analysis_result.get('description', '')
-            
-            # 安全處理價格
-            try:
-                price = analysis_result.get('recommended_price', 0)
-                if isinstance(price, str):
-                    import re
-                    price_str = re.sub(r'[^\d.]', '', price)
-                    product_image.recommended_price = float(price_str) if price_str else 0
-                else:
-                    product_image.recommended_price = float(price) if price else 0
-            except (ValueError, TypeError):
-                product_image.recommended_price = 0
-                
-            product_image.analysis_json = analysis_result
-            product_image.analyzed = True
+            _apply_analysis(product_image, analysis_result)
             product_image.save()
             
             return JsonResponse({
@@ -137,8 +163,10 @@ def api_analyze(request):
                 'success': False,
                 'error': '表單驗證失敗',
                 'form_errors': form.errors
-            }, status=400)
+            }, status=413 if form.has_error('image', 'file_too_large') else 400)
             
+    except UpstreamBusy:
+        raise
     except Exception as e:
         return JsonResponse({
             'success': False,
@@ -189,6 +217,7 @@ def generate_story(request, pk):
 
 @csrf_exempt
 @require_http_methods(["POST"])
+@admission_control
 def api_generate_story(request):
     """API 端點：生成產品故事"""
     try:
@@ -235,8 +264,260 @@ def api_generate_story(request):
             }
         })
         
+    except UpstreamBusy:
+        raise
     except Exception as e:
         return JsonResponse({
             'success': False,
             'error': f'故事生成失敗: {str(e)}'
-        }, status=500)
\ No newline at end of file
+        }, status=500)
+
+# ---------------------------------------------------------------------------
+# 唯讀 JSON API：商品列表與詳細資料
+# ---------------------------------------------------------------------------
+
+# 對外欄位名稱 -> 模型欄位名稱（供 fields= 投影與 .only() 使用）
+API_FIELDS = {
+    'id': 'id',
+    'image': 'image',
+    'uploaded_at': 'uploaded_at',
+    'product_name': 'product_name',
+    'description': 'description',
+    'recommended_price': 'recommended_price',
+    'analyzed': 'analyzed',
+    'analysis': 'analysis_json',
+    'category': 'category',
+    'target_audience': 'target_audience',
+    'features': 'features',
+    'usage_scenarios': 'usage_scenarios',
+    'story_content': 'story_content',
+    'story_style': 'story_style',
+    'story_prompt': 'story_prompt',
+    'story_generated': 'story_generated',
+}
+# 多對多欄位：以 prefetch_related 載入，不能放進 .only()
+API_MANY_FIELDS = {'features', 'usage_scenarios'}
+API_DEFAULT_PAGE_SIZE = 20
+API_MAX_PAGE_SIZE = 100
+API_JSON_PARAMS = {'ensure_ascii': False, 'separators': (',', ':')}
+
+
+def _api_fields(request):
+    """解析 fields= 參數，回傳 (欄位清單, 無效欄位清單)"""
+    raw = request.GET.get('fields', '')
+    if not raw:
+        return list(API_FIELDS), []
+    requested = [name.strip() for name in raw.split(',') if name.strip()]
+    invalid = [name for name in requested if name not in API_FIELDS]
+    fields = [name for name in API_FIELDS if name in requested]
+    return fields, invalid
+
+
+def _encode_cursor(pk):
+    """將最後一筆的 pk 編碼為不透明游標"""
+    return base64.urlsafe_b64encode(str(pk).encode()).decode().rstrip('=')
+
+
+def _decode_cursor(cursor):
+    """解碼游標，格式錯誤時回傳 None"""
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        return int(base64.urlsafe_b64decode(padded.encode()).decode())
+    except (ValueError, UnicodeDecodeError):
+        return None
+
+
+def _compact_analysis(analysis):
+    """精簡 analysis_json：移除空值欄位"""
+    if not isinstance(analysis, dict):
+        return analysis
+    return {key: value for key, value in analysis.items() if value not in (None, '', [], {})}
+
+
+def _api_queryset(fields):
+    """依投影欄位建立查詢：一般欄位以 .only() 投影，類別以 JOIN 取名稱，多對多欄位預先載入"""
+    columns = {API_FIELDS[name] for name in fields if name not in API_MANY_FIELDS} | {'id'}
+    queryset = ProductImage.objects.all()
+    if 'category' in fields:
+        queryset = queryset.select_related('category')
+        columns.add('category__name')
+    many = [API_FIELDS[name] for name in fields if name in API_MANY_FIELDS]
+    if many:
+        queryset = queryset.prefetch_related(*many)
+    return queryset.only(*columns)
+
+
+def _serialize_product(product, fields):
+    """依投影欄位序列化 ProductImage"""
+    data = {}
+    for name in fields:
+        value = getattr(product, API_FIELDS[name])
+        if name == 'image':
+            value = value.url if value else None
+        elif name == 'uploaded_at':
+            value = value.isoformat()
+        elif name == 'recommended_price':
+            value = float(value) if value is not None else None
+        elif name == 'analysis':
+            value = _compact_analysis(value)
+        elif name == 'category':
+            value = value.name if value else None
+        elif name in API_MANY_FIELDS:
+            value = [item.name for item in value.all()]
+        data[name] = value
+    return data
+
+
+def _api_page(request):
+    """取得目前頁面的 (pk, version, updated_at) 視窗，結果快取於 request 上"""
+    if not hasattr(request, '_api_page'):
+        page = None
+        try:
+            limit = int(request.GET.get('limit', API_DEFAULT_PAGE_SIZE))
+        except ValueError:
+            limit = API_DEFAULT_PAGE_SIZE
+        limit = max(1, min(limit, API_MAX_PAGE_SIZE))
+        
+        queryset = ProductImage.objects.order_by('-pk')
+        try:
+            queryset = filter_products(queryset, request.GET)
+        except ValueError as e:
+            request._api_error = str(e)
+            queryset = None
+        
+        cursor = request.GET.get('cursor')
+        if cursor and queryset is not None:
+            cursor_pk = _decode_cursor(cursor)
+            if cursor_pk is None:
+                request._api_error = '無效的游標'
+                queryset = None
+            else:
+                queryset = queryset.filter(pk__lt=cursor_pk)
+        
+        if queryset is not None:
+            rows = list(queryset.values_list('pk', 'version', 'updated_at')[:limit + 1])
+            page = {
+                'rows': rows[:limit],
+                'has_more': len(rows) > limit,
+            }
+        request._api_page = page
+    return request._api_page
+
+
+def _api_product_row(request, pk):
+    """取得單筆商品的 (version, updated_at)，結果快取於 request 上"""
+    if not hasattr(request, '_api_row'):
+        request._api_row = (
+            ProductImage.objects.filter(pk=pk)
+            .values_list('version', 'updated_at')
+            .first()
+        )
+    return request._api_row
+
+
+def _product_list_etag(request):
+    """列表 ETag：由頁面內每筆資料的版本與查詢參數組成"""
+    page = _api_page(request)
+    if page is None:
+        return None
+    digest = hashlib.sha1()
+    digest.update(request.GET.get('fields', '').encode())
+    for pk, version, _ in page['rows']:
+        digest.update(f'{pk}:{version};'.encode())
+    digest.update(b'+' if page['has_more'] else b'.')
+    return digest.hexdigest()
+
+
+def _product_list_last_modified(request):
+    """列表 Last-Modified：頁面內最新的更新時間"""
+    page = _api_page(request)
+    if not page or not page['rows']:
+        return None
+    return max(updated_at for _, _, updated_at in page['rows'])
+
+
+def _product_detail_etag(request, pk):
+    """詳細資料 ETag：由 pk、資料版本與投影欄位組成"""
+    row = _api_product_row(request, pk)
+    if row is None:
+        return None
+    fields_token = hashlib.sha1(request.GET.get('fields', '').encode()).hexdigest()[:8]
+    return f'{pk}-{row[0]}-{fields_token}'
+
+
+def _product_detail_last_modified(request, pk):
+    """詳細資料 Last-Modified"""
+    row = _api_product_row(request, pk)
+    return row[1] if row else None
+
+
+@require_http_methods(["GET", "HEAD"])
+@condition(etag_func=_product_list_etag, last_modified_func=_product_list_last_modified)
+def api_product_list(request):
+    """API 端點：商品列表（游標分頁，可依類別、價格、特色、場景篩選）"""
+    fields, invalid = _api_fields(request)
+    if invalid:
+        return JsonResponse({
+            'success': False,
+            'error': f'無效的欄位：{", ".join(invalid)}'
+        }, status=400)
+    
+    page = _api_page(request)
+    if page is None:
+        return JsonResponse({
+            'success': False,
+            'error': request._api_error
+        }, status=400)
+    
+    pks = [pk for pk, _, _ in page['rows']]
+    products = _api_queryset(fields).filter(pk__in=pks).order_by('-pk')
+    next_cursor = _encode_cursor(pks[-1]) if page['has_more'] else None
+    
+    return JsonResponse({
+        'success': True,
+        'data': {
+            'results': [_serialize_product(product, fields) for product in products],
+            'next_cursor': next_cursor
+        }
+    }, json_dumps_params=API_JSON_PARAMS)
+
+
+@require_http_methods(["GET", "HEAD"])
+@condition(etag_func=_product_detail_etag, last_modified_func=_product_detail_last_modified)
+def api_product_detail(request, pk):
+    """API 端點：商品詳細資料"""
+    fields, invalid = _api_fields(request)
+    if invalid:
+        return JsonResponse({
+            'success': False,
+            'error': f'無效的欄位：{", ".join(invalid)}'
+        }, status=400)
+    
+    product_image = _api_queryset(fields).filter(pk=pk).first()
+    if product_image is None:
+        return JsonResponse({
+            'success': False,
+            'error': '找不到商品'
+        }, status=404)
+    
+    return JsonResponse({
+        'success': True,
+        'data': _serialize_product(product_image, fields)
+    }, json_dumps_params=API_JSON_PARAMS)
+
+
+@require_http_methods(["GET", "HEAD"])
+def api_catalog(request):
+    """API 端點：類別統計、各類別售價百分位數與特色 / 場景 facets（套用與商品列表相同的篩選條件）"""
+    try:
+        summary = catalog_summary(request.GET)
+    except ValueError as e:
+        return JsonResponse({
+            'success': False,
+            'error': str(e)
+        }, status=400)
+    
+    return JsonResponse({
+        'success': True,
+        'data': summary
+    }, json_dumps_params=API_JSON_PARAMS)
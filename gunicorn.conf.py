@@ -0,0 +1,14 @@
+# gunicorn 設定：在 master 中預載應用程式，worker 由已預熱的 master fork 出來
+import os
+
+bind = f"0.0.0.0:{os.getenv('PORT', '8000')}"
+workers = int(os.getenv('WEB_CONCURRENCY', '2'))
+preload_app = True
+# 上游呼叫（含排隊等待名額與 single-flight 等待）可能超過預設的 30 秒
+timeout = int(os.getenv('GUNICORN_TIMEOUT', '120'))
+
+
+def post_fork(server, worker):
+    # 資料庫連線不可跨 process 共用，確保每個 worker 各自建立連線
+    from django.db import connections
+    connections.close_all()
@@ -11,7 +11,9 @@ https://docs.djangoproject.com/en/5.2/ref/settings/
 """
 
 from pathlib import Path
+import json
 import os
+import tempfile
 from dotenv import load_dotenv
 
 # 載入環境變數
@@ -53,6 +55,7 @@ MIDDLEWARE = [
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    'analyzer.middleware.UploadSizeLimitMiddleware',
 ]
 
 ROOT_URLCONF = 'product_analyzer.urls'
@@ -128,10 +131,61 @@ STATICFILES_DIRS = [
 # 媒體檔案設定
 MEDIA_URL = '/media/'
 MEDIA_ROOT = BASE_DIR / 'media'
+# 孤兒檔案寬限期（秒）：在此期間內寫入或被重複使用的檔案不會被刪除
+MEDIA_ORPHAN_GRACE = int(os.getenv('MEDIA_ORPHAN_GRACE', 3600))
+
+# 上傳限制：在寫入磁碟與呼叫 OpenAI 之前拒絕過大或不支援的圖片
+UPLOAD_MAX_BYTES = int(os.getenv('UPLOAD_MAX_BYTES', 10 * 1024 * 1024))
+UPLOAD_MAX_PIXELS = int(os.getenv('UPLOAD_MAX_PIXELS', 40_000_000))
+UPLOAD_ALLOWED_FORMATS = ['JPEG', 'PNG', 'GIF', 'WEBP']
+
+FILE_UPLOAD_HANDLERS = [
+    'analyzer.uploadhandlers.UploadSizeLimitHandler',
+    'django.core.files.uploadhandler.MemoryFileUploadHandler',
+    'django.core.files.uploadhandler.TemporaryFileUploadHandler',
+]
 
 # OpenAI API 設定
 OPENAI_API_KEY = os.getenv('OPENAI_API_KEY')
 
+# OpenAI 相容後端池：可設定多組 API 金鑰與端點（例如本地閘道），格式為 JSON 陣列：
+# [{"name": "main", "api_key": "sk-...", "base_url": "https://api.openai.com/v1"}, ...]
+# 未設定時使用 OPENAI_API_KEY 作為唯一後端
+OPENAI_BACKENDS = json.loads(os.getenv('OPENAI_BACKENDS', '[]')) or (
+    [{'name': 'default', 'api_key': OPENAI_API_KEY}] if OPENAI_API_KEY else []
+)
+# 後端發生錯誤時的剔除秒數（連續失敗時加倍）與上限
+OPENAI_BACKEND_EJECT_SECONDS = int(os.getenv('OPENAI_BACKEND_EJECT_SECONDS', 30))
+OPENAI_BACKEND_MAX_EJECT_SECONDS = int(os.getenv('OPENAI_BACKEND_MAX_EJECT_SECONDS', 600))
+# 後端未回報配額重置時間時，剩餘配額讀數的有效秒數
+OPENAI_BACKEND_QUOTA_TTL = float(os.getenv('OPENAI_BACKEND_QUOTA_TTL', 5))
+
+# 合併相同的進行中 OpenAI 請求（跨 worker 以此目錄中的檔案鎖與結果檔共用）
+SINGLE_FLIGHT_DIR = os.getenv('SINGLE_FLIGHT_DIR', os.path.join(tempfile.gettempdir(), 'product_analyzer_singleflight'))
+SINGLE_FLIGHT_WAIT = int(os.getenv('SINGLE_FLIGHT_WAIT', 120))
+# 商品分析完成後仍可共用結果的秒數（供逾時重試）；故事生成只共用進行中的呼叫，重新生成一律重新呼叫
+SINGLE_FLIGHT_ANALYZE_GRACE = int(os.getenv('SINGLE_FLIGHT_ANALYZE_GRACE', 30))
+SINGLE_FLIGHT_SWEEP_INTERVAL = int(os.getenv('SINGLE_FLIGHT_SWEEP_INTERVAL', 60))
+
+# API 入口控管：每個用戶端（已核發的 X-API-Key 或 IP）的 token bucket 限流與全域上游併發上限
+ADMISSION_RATE = float(os.getenv('ADMISSION_RATE', 0.2))  # 每秒補充的請求額度
+ADMISSION_BURST = int(os.getenv('ADMISSION_BURST', 5))  # 額度上限（可瞬間連發的請求數）
+# 同時進行的 API 上游呼叫上限；預設小於 gunicorn worker 數，保留 worker 給網頁使用者
+ADMISSION_MAX_CONCURRENT = int(os.getenv('ADMISSION_MAX_CONCURRENT', 1))
+# 等待名額的秒數：名額只在實際呼叫上游時佔用（一次圖片分析約 10–20 秒），
+# 排隊時間應能涵蓋一次呼叫，且排隊加上呼叫時間需小於 gunicorn 的 worker timeout
+ADMISSION_QUEUE_TIMEOUT = float(os.getenv('ADMISSION_QUEUE_TIMEOUT', 30))
+ADMISSION_RETRY_AFTER = int(os.getenv('ADMISSION_RETRY_AFTER', 10))
+ADMISSION_SLOT_DIR = os.getenv('ADMISSION_SLOT_DIR', os.path.join(tempfile.gettempdir(), 'product_analyzer_admission'))
+# 前方反向代理的層數（如 Render 為 1），用於由 X-Forwarded-For 取得真實來源 IP
+ADMISSION_PROXY_COUNT = int(os.getenv('ADMISSION_PROXY_COUNT', 0))
+# 已核發的 API 金鑰（逗號分隔），帶有這些金鑰的請求各自擁有獨立額度；其他請求依來源 IP 限流
+ADMISSION_API_KEYS = {key.strip() for key in os.getenv('ADMISSION_API_KEYS', '').split(',') if key.strip()}
+
+# 延遲匯入模式：True 時 openai、PIL 等模組僅在第一次使用時載入；
+# False 時於載入 WSGI 應用程式（gunicorn preload）時預先匯入
+LAZY_IMPORTS = os.getenv('LAZY_IMPORTS', 'False') == 'True'
+
 # Default primary key field type
 # https://docs.djangoproject.com/en/5.2/ref/settings/#default-auto-field
 
@@ -9,8 +9,14 @@ https://docs.djangoproject.com/en/5.2/howto/deployment/wsgi/
 
 import os
 
+from django.conf import settings
 from django.core.wsgi import get_wsgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'product_analyzer.settings')
 
 application = get_wsgi_application()
+
+# 非延遲匯入模式下，於載入應用程式時（gunicorn --preload 即在 master 中）預先匯入重量級模組
+if not settings.LAZY_IMPORTS:
+    from analyzer.startup import preload_modules
+    preload_modules()